@@ -23,10 +23,12 @@ Public License for more details.
 
 import numpy as np
 from copy import copy, deepcopy
-import os,time,platform,shutil,sys
-from subprocess import Popen, PIPE, CREATE_NEW_CONSOLE
-from time import sleep
+import os,platform,shutil,sys,pickle,asyncio
+from subprocess import Popen, PIPE, STDOUT, TimeoutExpired, CREATE_NEW_CONSOLE
+from time import sleep, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from collections import Counter
+from io import StringIO, BytesIO
 from matplotlib.patches import Rectangle
 
 try: import ctypes; has_ctypes = True
@@ -248,6 +250,13 @@ def _title_string(s,n): 						#prepends headers to sections of FEHM input file
     ws+='\n'
     return ws
 def _zone_ind(indStr): return abs(int(indStr))-(int(indStr)+abs(int(indStr)))/2
+def _macro_sort_key(macro): 					#macros written in zone order, followed by node (JA JB JC) macros in order added
+    zn = macro.zone
+    if isinstance(zn,tuple): return (1,0)
+    if isinstance(zn,list) and zn: zn = zn[0]
+    if isinstance(zn,fzone): return (0,zn.index)
+    if isinstance(zn,int): return (0,zn)
+    return (0,0)
 class fzone(object):						#FEHM zone object.
     """FEHM Zone object.
     
@@ -882,6 +891,7 @@ class fzone(object):						#FEHM zone object.
         else:
             self._parent.add(fmacro('perm',zone=self.index,param=(('kx',kx),('ky',ky),('kz',kz))))
         if self._parent:
+            self._parent.grid._own_nodes(self.nodelist) 		# node properties not shared with clones
             for nd in self.nodelist:
                 if not (nd.permeability is not None and self.index == 0): 
                     nd._permeability = np.array([kx,ky,kz])
@@ -901,6 +911,7 @@ class fzone(object):						#FEHM zone object.
         else:
             self._parent.add(fmacro('cond',zone=self.index,param=(('cond_x',kx),('cond_y',ky),('cond_z',kz))))
         if self._parent:
+            self._parent.grid._own_nodes(self.nodelist) 		# node properties not shared with clones
             for nd in self.nodelist:
                 if not (nd.conductivity is not None and self.index == 0): 
                     nd._conductivity = np.array([kx,ky,kz])
@@ -932,6 +943,7 @@ class fzone(object):						#FEHM zone object.
         
         # node association
         if self._parent:
+            self._parent.grid._own_nodes(self.nodelist) 		# node properties not shared with clones
             for nd in self._nodelist:
                 if isinstance(nd,int): nd = self._parent.grid.node[nd]
                 if len(set([zn.index for zn in nd.zonelist])-set([994,995,996,997,998,999]))==0:
@@ -990,6 +1002,7 @@ class fzone(object):						#FEHM zone object.
                 self._parent.pres[self.index].param['saturation']=1
                 self.Si = 1.
         if self._parent:
+            self._parent.grid._own_nodes(self.nodelist) 		# node properties not shared with clones
             for nd in self.nodelist:
                 if not (nd.Pi is not None and self.index == 0): 
                     nd._Pi = value
@@ -1015,6 +1028,7 @@ class fzone(object):						#FEHM zone object.
             self._parent.pres[self.index].param['saturation']=1
             self._Si = 1.
         if self._parent:
+            self._parent.grid._own_nodes(self.nodelist) 		# node properties not shared with clones
             for nd in self.nodelist:
                 if not (nd.Ti is not None and self.index == 0): 
                     nd._Ti = value
@@ -1035,6 +1049,7 @@ class fzone(object):						#FEHM zone object.
             _buildWarnings('WARNING: Assigning default initial pressure (%4.1f'%dflt.Pi+' MPa, two phase) to zone '+str(self.index)+'.')
         self._Ti = tsat(self._parent.pres[self.index].param['pressure'])[0]
         if self._parent:
+            self._parent.grid._own_nodes(self.nodelist) 		# node properties not shared with clones
             for nd in self.nodelist:
                 if not (nd.Si is not None and self.index == 0): 
                     nd._Si = value
@@ -1367,11 +1382,13 @@ class fincon(object): 						#FEHM restart object.
     def __setstate__(self, data_dict):
         for (name, value) in data_dict.items():
             setattr(self, name, value)
-    def read(self,inconfilename='',if_new = False):
+    def read(self,inconfilename='',if_new = False,associate = True):
         '''Parse a restart file for variable information.
         
         :param inconfilename: Name of restart file.
         :type inconfilename: str
+        :param associate: Assign the restart data to grid nodes after reading. Set False to keep the data as arrays only.
+        :type associate: bool
         '''
         if inconfilename: self._path.filename = inconfilename
         
@@ -1403,48 +1420,40 @@ class fincon(object): 						#FEHM restart object.
         while True:
             var = lns[cnt]; cnt +=1
             if var.startswith('no fluxes') or var == -1: break
-            # read in data
-            values = []
-            while len(values) != node_number:
-                values += lns[cnt].strip().split(); cnt +=1
+            # read in data, assuming all full lines hold the same number of values as the first
+            per_line = len(lns[cnt].split())
+            nlines = int(np.ceil(node_number/float(per_line)))
+            values = ' '.join(lns[cnt:cnt+nlines]).split()
+            if len(values) == node_number: cnt += nlines
+            else:
+                values = []
+                while len(values) != node_number:
+                    values += lns[cnt].strip().split(); cnt +=1
             # save to attribute
-            if var.startswith('temperature') or var.startswith('co2temperat'): 
-                self._T = np.array([float(v) for v in values])
-            if var.startswith('pressure') or var.startswith('co2pressure'): 
-                self._P = np.array([float(v) for v in values])
-            if var.startswith('saturation') or var.startswith('wsaturation'): 
-                self._S = np.array([float(v) for v in values])
-            if var.startswith('lco2saturat'): 
-                self._S_co2l = np.array([float(v) for v in values])
-            if var.startswith('dissolvdco2'): 
-                self._co2aq = np.array([float(v) for v in values])
-            if var.startswith('eoswater'): 
-                self._eos = np.array([int(v) for v in values])
-            if var.startswith('eosco2'): 
-                self._co2_eos = np.array([int(v) for v in values])
-            if var.startswith('eosdc'): 
-                self._dc_eos = np.array([int(v) for v in values])
-            if var.startswith('xstress'): 
-                self._strs_xx = np.array([float(v) for v in values])
-            if var.startswith('ystress'): 
-                self._strs_yy = np.array([float(v) for v in values])
-            if var.startswith('zstress'): 
-                self._strs_zz = np.array([float(v) for v in values])
-            if var.startswith('xystress'): 
-                self._strs_xy = np.array([float(v) for v in values])
-            if var.startswith('xzstress'): 
-                self._strs_xz = np.array([float(v) for v in values])
-            if var.startswith('yzstress'): 
-                self._strs_yz = np.array([float(v) for v in values])
-            if var.startswith('xdisplacmnt'): 
-                self._disp_x = np.array([float(v) for v in values])
-            if var.startswith('ydisplacmnt'): 
-                self._disp_y = np.array([float(v) for v in values])
-            if var.startswith('zdisplacmnt'): 
-                self._disp_z = np.array([float(v) for v in values])
+            if var.startswith('eoswater') or var.startswith('eosco2') or var.startswith('eosdc'):
+                values = np.array(values,dtype=int)
+            else:
+                values = np.array(values,dtype=float)
+            if var.startswith('temperature') or var.startswith('co2temperat'): self._T = values
+            if var.startswith('pressure') or var.startswith('co2pressure'): self._P = values
+            if var.startswith('saturation') or var.startswith('wsaturation'): self._S = values
+            if var.startswith('lco2saturat'): self._S_co2l = values
+            if var.startswith('dissolvdco2'): self._co2aq = values
+            if var.startswith('eoswater'): self._eos = values
+            if var.startswith('eosco2'): self._co2_eos = values
+            if var.startswith('eosdc'): self._dc_eos = values
+            if var.startswith('xstress'): self._strs_xx = values
+            if var.startswith('ystress'): self._strs_yy = values
+            if var.startswith('zstress'): self._strs_zz = values
+            if var.startswith('xystress'): self._strs_xy = values
+            if var.startswith('xzstress'): self._strs_xz = values
+            if var.startswith('yzstress'): self._strs_yz = values
+            if var.startswith('xdisplacmnt'): self._disp_x = values
+            if var.startswith('ydisplacmnt'): self._disp_y = values
+            if var.startswith('zdisplacmnt'): self._disp_z = values
         infile.close()
             
-        if self._parent: self._parent._associate_incon()
+        if self._parent and associate: self._parent._associate_incon()
         
         if if_new: return True
     def write(self,inconfilename=''):
@@ -1514,17 +1523,23 @@ class fincon(object): 						#FEHM restart object.
         for header,variable,format,N,nan_sub in zip(headers,variables,formats,Ns,nan_subs):
             if (len(variable) != 0):
                 outfile.write(header+'\n')
-                cnt = 0
-                for val in variable:
-                    if val != val: val = nan_sub
-                    if N != 30 and not (header.endswith('ess') or header.endswith('displacmnt')): val = np.max([val,1.e-98])
-                    outfile.write(format % val + '    ')
-                    cnt +=1
-                    if cnt == N: outfile.write('\n'); cnt = 0
-                if cnt!=0: outfile.write('\n')		
+                values = np.array(variable,dtype=float)
+                values[np.isnan(values)] = nan_sub
+                if N != 30 and not (header.endswith('ess') or header.endswith('displacmnt')): values = np.maximum(values,1.e-98)
+                # format whole block at once, N values per line
+                full,partial = divmod(len(values),N)
+                template = ((format+'    ')*N+'\n')*full
+                if partial: template += (format+'    ')*partial+'\n'
+                outfile.write(template % tuple(values))
         outfile.write('no fluxes\n\n')
         outfile.close()
         self._writeOut = False
+    def _content_signature(self):			#Digest of restart data, used to skip unchanged writes.
+        stressflag = None
+        if self._parent: stressflag = self._parent.strs.param['ISTRS']
+        return content_hash(self._time,self._source,stressflag,*[np.asarray(v) for v in [self._T,self._P,self._S,
+            self._S_co2l,self._co2aq,self._eos,self._co2_eos,self._dc_eos,self._disp_x,self._disp_y,self._disp_z,
+            self._strs_xx,self._strs_yy,self._strs_xy,self._strs_zz,self._strs_xz,self._strs_yz]])
     def stressgrad(self,xgrad,ygrad,zgrad,xygrad = 0.,xzgrad=0.,yzgrad=0.,calculate_vertical=False,vertical_fraction=False):
         '''Construct initial stress state with vertical stress gradients.
         
@@ -1557,28 +1572,25 @@ class fincon(object): 						#FEHM restart object.
             if not self._parent._associate: 
                 pyfehm_print('ERROR: node property association required to access density data - set associate=True in data file',self._silent)
                 return
-            xs = np.unique([nd.position[0] for nd in self._parent.grid.nodelist])
-            ys = np.unique([nd.position[1] for nd in self._parent.grid.nodelist])
-            # for each x and y, find the column of z-values corresponding
-            zs = []
-            for x in xs:
-                for y in ys:
-                    zs.append(((x,y),[]))
-            zs = dict(zs)
-            for nd in self._parent.grid.nodelist:
-                zs[(nd.position[0],nd.position[1])].append(nd)
-            self._strs_zz = np.zeros((1,self._parent.grid.number_nodes))[0]
-            for k in list(zs.keys()):
-                zs[k].sort(key=lambda x: x.position[2],reverse=True)
-                z0 = zs[k][0].position[2]; sz = [0+zgrad]
-                oldRho = zs[k][0].density
-                oldZ = zs[k][0].position[2]
-                for z in zs[k][1:]:
-                    sz.append(sz[-1]+9.81*(oldRho+z.density)*abs(z.position[2]-oldZ)/2/1e6)
-                    oldRho = z.density
-                    oldZ = z.position[2]
-                for nd,szi in zip(zs[k],sz):
-                    self._strs_zz[nd.index-1] = szi			
+            grid = self._parent.grid
+            rho = grid.node_array('density')
+            if np.isnan(rho).any():
+                pyfehm_print('ERROR: density not defined at '+str(np.sum(np.isnan(rho)))+' nodes - assign density (e.g., rock macro) before integrating vertical stress',self._silent)
+                return
+            pos = grid.node_array('position')
+            inds = grid.node_array('index')-1
+            # sort nodes into columns of equal x and y, each ordered from top to bottom
+            order = np.lexsort((-pos[:,2],pos[:,1],pos[:,0]))
+            x,y,z,rho = pos[order,0],pos[order,1],pos[order,2],rho[order]
+            new_column = np.concatenate([[True],(x[1:]!=x[:-1])|(y[1:]!=y[:-1])])
+            # trapezoidal integration of density down each column, restarting at the top of each
+            dsz = 9.81*(rho[1:]+rho[:-1])*abs(z[1:]-z[:-1])/2/1e6
+            dsz[new_column[1:]] = 0.
+            sz = np.concatenate([[0.],np.cumsum(dsz)])
+            column = np.cumsum(new_column)-1
+            sz = sz - sz[np.flatnonzero(new_column)][column] + zgrad
+            self._strs_zz = np.zeros(self._parent.grid.number_nodes)
+            self._strs_zz[inds[order]] = sz
             if vertical_fraction:
                 if isinstance(xgrad,(list,tuple)) and len(xgrad) == 2:
                     self._strs_xx = list(xgrad[0]*np.array(self.strs_zz)+xgrad[1])
@@ -2800,6 +2812,194 @@ class files(object):						#FEHM file constructor.
     def _get_co2_inj_time(self): return self._co2_inj_time	
     def _set_co2_inj_time(self,value):  self._co2_inj_time = value
     co2_inj_time = property(_get_co2_inj_time,_set_co2_inj_time)#: (*fl64*) Number of years at which FEHM will terminate co2 injection
+class _archive_pickler(pickle.Pickler):			#Pickler storing model, grid, node, element and connection objects as references.
+    def __init__(self,file,model):
+        pickle.Pickler.__init__(self,file,pickle.HIGHEST_PROTOCOL)
+        self._model = model
+        self._grid = model.grid
+    def persistent_id(self,obj):
+        if obj is self._model: return 'model'
+        if obj is self._grid: return 'grid'
+        if isinstance(obj,fnode):
+            if self._grid._node.get(obj.index) is obj: return obj.index
+        elif isinstance(obj,felem):
+            if self._grid._elem.get(obj.index) is obj: return ('elem',obj.index)
+        elif isinstance(obj,fconn):
+            key = (obj.nodes[0].index,obj.nodes[1].index)
+            if self._grid._conn.get(key) is obj: return ('conn',)+key
+        return None
+class _archive_unpickler(pickle.Unpickler):		#Unpickler resolving references written by _archive_pickler.
+    def __init__(self,file,model,grid):
+        pickle.Unpickler.__init__(self,file)
+        self._model = model
+        self._grid = grid
+    def persistent_load(self,pid):
+        if pid == 'model': return self._model
+        if pid == 'grid': return self._grid
+        if isinstance(pid,tuple):
+            if pid[0] == 'elem': return self._grid._elem[pid[1]]
+            return self._grid._conn[pid[1:]]
+        return self._grid._node[pid]
+class _run_monitor(object):					#Watches output files written by FEHM during run(until=...).
+    __slots__ = ['_parent','_dir','_skip','_stats','_offsets','changed','new_text','output_time','kill_latency']
+    def __init__(self,parent,directory=None):
+        self._parent = parent
+        if directory is None: directory = os.getcwd()
+        self._dir = directory
+        files = parent.files
+        self._skip = [os.path.split(file)[-1] for file in [files.input,files.grid,files.incon,'fehmn.files'] if file]
+        self._stats = {} 			# modification time and size of each file when last read
+        for file in self._watched():
+            try: stat = os.stat(self._dir+os.sep+file)
+            except OSError: continue
+            self._stats[file] = (stat.st_mtime,stat.st_size) 		# left over from earlier run, ignored until changed
+        self._offsets = {} 			# bytes already read from each file
+        self.changed = []
+        self.new_text = {}
+        self.output_time = None
+        self.kill_latency = None
+    def _watched(self):
+        root = self._parent.files.root
+        return [file for file in os.listdir(self._dir) if file.startswith(root) and file not in self._skip]
+    def check(self):
+        '''Read output files that have changed since the last check. The restart file is read into the model incon, and text appended to 
+        other files (history, contour, output) is stored in new_text. Returns True if any files changed.
+        '''
+        self.changed = []
+        self.new_text = {}
+        rsto = os.path.split(self._parent.files.rsto)[-1]
+        for file in self._watched():
+            path = self._dir+os.sep+file
+            try: stat = os.stat(path)
+            except OSError: continue
+            if self._stats.get(file) == (stat.st_mtime,stat.st_size): continue
+            if file == rsto:
+                try: self._parent.incon.read(path)
+                except Exception: continue 		# partially written, read at next check
+            else:
+                offset = self._offsets.get(file,0)
+                if stat.st_size < offset: offset = 0 		# file rewritten
+                infile = open(path,'rb')
+                infile.seek(offset)
+                text = infile.read()
+                infile.close()
+                self._offsets[file] = offset+len(text)
+                self.new_text[file] = text.decode('utf-8','replace')
+            self._stats[file] = (stat.st_mtime,stat.st_size)
+            self.changed.append(file)
+        if self.changed: self.output_time = max([self._stats[file][0] for file in self.changed])
+        return len(self.changed)>0
+class fcache(object):						#Cache of completed simulation output.
+    '''Content-addressed cache of simulation output. When passed to :meth:`fdata.run`, a simulation with input, grid, restart and stor 
+    files and FEHM executable identical to those of an earlier, completed simulation is not run. Instead, the output of the earlier 
+    simulation is restored from the cache. Output is copied to and from the cache, so files later rewritten in the work directory (by FEHM 
+    or PyFEHM) do not change cached output. Least recently used entries are removed when the cache exceeds its size limit.
+    
+    :param directory: Directory in which simulation output is cached.
+    :type directory: str
+    :param max_size: Maximum size of the cache (MB). Unlimited by default.
+    :type max_size: fl64
+    '''
+    __slots__ = ['_directory','_max_size','_hits','_misses','_silent']
+    def __init__(self,directory='pyfehm_cache',max_size=None):
+        self._directory = os.path.abspath(directory)
+        if not os.path.isdir(self._directory): os.makedirs(self._directory)
+        self._max_size = max_size
+        self._hits = 0
+        self._misses = 0
+        self._silent = dflt.silent
+    def __repr__(self): return 'Simulation cache at '+self._directory
+    def __getstate__(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+    def __setstate__(self, data_dict):
+        for (name, value) in data_dict.items():
+            setattr(self, name, value)
+    def _key(self,dat,wd,exe):					#Digest of files read by FEHM and executable identity, wd ends with separator.
+        items = []
+        paths = [dat.files.input,dat.files.grid]
+        if dat.files.incon: paths.append(dat.files.incon)
+        if dat.files._use_stor: paths.append(dat.files.stor)
+        for path in paths+['fehmn.files']:
+            if not os.path.isabs(path): path = wd+path
+            if os.path.isfile(path):
+                infile = open(path,'rb')
+                items.append(infile.read().replace(wd.encode(),b'')) 	# independent of work directory
+                infile.close()
+            else: items.append(path)
+        exe_file = exe.split()[-1]
+        if os.path.isfile(exe_file): 
+            stat = os.stat(exe_file)
+            items.append((exe,stat.st_size,stat.st_mtime))
+        else: items.append(exe)
+        return content_hash(*items)
+    def _restore(self,key,wd):					#Restore cached output to work directory, returns False if not cached.
+        entry = self._directory+os.sep+key
+        if not os.path.isfile(entry+os.sep+'manifest.txt'): 
+            self._misses += 1
+            return False
+        infile = open(entry+os.sep+'manifest.txt','r')
+        names = [name for name in infile.read().split('\n') if name]
+        infile.close()
+        for name in names: _replace_file(entry+os.sep+name,wd+name)
+        os.utime(entry+os.sep+'manifest.txt') 		# most recently used
+        self._hits += 1
+        return True
+    def _snapshot(self,wd): 					#Modification times of files in work directory before a simulation.
+        return dict([(name,os.path.getmtime(wd+name)) for name in os.listdir(wd) if os.path.isfile(wd+name)])
+    def _store(self,key,wd,snapshot):			#Cache files written or changed in work directory since snapshot.
+        entry = self._directory+os.sep+key
+        if os.path.isdir(entry): shutil.rmtree(entry)
+        os.makedirs(entry)
+        names = [name for name in os.listdir(wd) if os.path.isfile(wd+name) and snapshot.get(name) != os.path.getmtime(wd+name)]
+        for name in names: _replace_file(wd+name,entry+os.sep+name)
+        outfile = open(entry+os.sep+'manifest.txt','w') 		# written last, marks entry as complete
+        outfile.write('\n'.join(names)+'\n')
+        outfile.close()
+        self._evict()
+    def _entries(self): 						#Last use, size (bytes) and path of cache entries.
+        entries = []
+        for key in os.listdir(self._directory):
+            entry = self._directory+os.sep+key
+            if not os.path.isfile(entry+os.sep+'manifest.txt'): continue
+            size = sum([os.path.getsize(entry+os.sep+name) for name in os.listdir(entry)])
+            entries.append((os.path.getmtime(entry+os.sep+'manifest.txt'),size,entry))
+        return sorted(entries)
+    def _evict(self):
+        if self._max_size is None: return
+        entries = self._entries()
+        size = sum([entry[1] for entry in entries])
+        for last_used,entry_size,entry in entries:
+            if size <= self._max_size*1.e6: break
+            shutil.rmtree(entry)
+            size -= entry_size
+    def clear(self):
+        '''Remove all cached simulation output.
+        '''
+        for last_used,size,entry in self._entries(): shutil.rmtree(entry)
+    def _get_directory(self): return self._directory
+    directory = property(_get_directory) #: (*str*) Directory in which simulation output is cached.
+    def _get_max_size(self): return self._max_size
+    def _set_max_size(self,value): self._max_size = value; self._evict()
+    max_size = property(_get_max_size, _set_max_size) #: (*fl64*) Maximum size of the cache (MB), least recently used output is removed beyond this.
+    def _get_stats(self):
+        entries = self._entries()
+        return {'hits':self._hits,'misses':self._misses,'entries':len(entries),'size':sum([entry[1] for entry in entries])/1.e6}
+    stats = property(_get_stats) #: (*dict*) Cache hits and misses since creation, and number and total size (MB) of cached simulations.
+def _replace_file(source,destination):			#Copy file, replacing rather than overwriting destination, which may be linked elsewhere.
+    if os.path.isfile(destination): os.remove(destination)
+    shutil.copy2(source,destination)
+def _link_or_copy(source,destination):			#Hard link file, or copy if linking not possible.
+    if os.path.isfile(destination): os.remove(destination)
+    try: os.link(source,destination)
+    except OSError: shutil.copy2(source,destination)
+_master_files = {} 								# path and modification time of grid files written by run(), keyed by file extension (format) and content signature
+def _link_master_file(path,signature):			#Link path to grid file with same content and format written for another run, returns False if none.
+    key = (os.path.splitext(path)[1].lower(),signature)
+    if key not in _master_files: return False
+    master,mtime = _master_files[key]
+    if master == path or not os.path.isfile(master) or os.path.getmtime(master) != mtime: return False
+    _link_or_copy(master,path)
+    return True
 class fdata(object):						#FEHM data file.
     """Class for FEHM data file. 
     
@@ -2808,7 +3008,7 @@ class fdata(object):						#FEHM data file.
             '_bounlist','_cont','_ctrl','_grid','_incon','_hist','_iter','_nfinv','_nobr','_head','_flxn','_vapl','_adif','_rlpmlist','_sol',
             '_time','text','_times','_zonelist','_writeSubFiles','_strs','_ngas','_carb','_trac','_files','_verbose','_general_macrolist',
             '_tf','_ti','_dti','_dtmin','_dtmax','_dtn','_dtx','_sections','_help','_running','_unparsed_blocks','keep_unknown','_flxo',
-            '_output_times','_path','_vtk','_storage','_air']
+            '_output_times','_path','_vtk','_storage','_air','_section_cache','_written_files','_monitor']
     def __init__(self,filename='',gridfilename='',inconfilename='',sticky_zones=dflt.sticky_zones,associate=dflt.associate,work_dir = None,
         full_connectivity=dflt.full_connectivity,skip=[],keep_unknown=dflt.keep_unknown):		#Initialise data file
         from copy import copy
@@ -2859,6 +3059,9 @@ class fdata(object):						#FEHM data file.
         self._verbose = True
         self._silent = dflt.silent
         self._running = False 		# boolean indicating whether a simulation is in progress
+        self._section_cache = {} 		# rendered input file text, keyed by section, reused while section unchanged
+        self._written_files = {} 		# content signature and modification time of grid/incon files written by run()
+        self._monitor = None 		# output files watched during run(until=...)
         self._unparsed_blocks = {}
         self._sections = []
         self.keep_unknown = keep_unknown
@@ -3111,26 +3314,26 @@ class fdata(object):						#FEHM data file.
         if self.adif != None: self._write_adif(outfile); self._write_unparsed(outfile,'adif')
         if self.flxo: self._write_flxo(outfile); self._write_unparsed(outfile,'flxo')
         if len(self.zone)>1 and not self.sticky_zones: 
-            self._write_zonn_all(outfile)
+            self._write_section(outfile,'zone',self._write_zonn_all)
             self._write_unparsed(outfile,'zone')
         if self.cont.variables: self._write_cont(outfile); self._write_unparsed(outfile,'cont')
         if self.hist.variables: self._write_hist(outfile); self._write_unparsed(outfile,'hist')
-        if self.gradlist: self._write_macro(outfile,'grad'); self._write_unparsed(outfile,'grad')
-        if self.pres: self._write_macro(outfile,'pres'); self._write_unparsed(outfile,'pres')
+        if self.gradlist: self._write_section(outfile,'grad',self._write_macro,'grad'); self._write_unparsed(outfile,'grad')
+        if self.pres: self._write_section(outfile,'pres',self._write_macro,'pres'); self._write_unparsed(outfile,'pres')
         if self.ngas.dof != None: self._write_ngas(outfile); self._write_unparsed(outfile,'ngas')
         if self.bounlist: self._write_boun(outfile); self._write_unparsed(outfile,'boun')
-        if self.flow: self._write_macro(outfile,'flow'); self._write_unparsed(outfile,'flow')
-        if self.hflx: self._write_macro(outfile,'hflx'); self._write_unparsed(outfile,'hflx')
-        if self.perm: self._write_macro(outfile,'perm'); self._write_unparsed(outfile,'perm')
-        if self.rock: self._write_macro(outfile,'rock'); self._write_unparsed(outfile,'rock')
+        if self.flow: self._write_section(outfile,'flow',self._write_macro,'flow'); self._write_unparsed(outfile,'flow')
+        if self.hflx: self._write_section(outfile,'hflx',self._write_macro,'hflx'); self._write_unparsed(outfile,'hflx')
+        if self.perm: self._write_section(outfile,'perm',self._write_macro,'perm'); self._write_unparsed(outfile,'perm')
+        if self.rock: self._write_section(outfile,'rock',self._write_macro,'rock'); self._write_unparsed(outfile,'rock')
         if self.pporlist: self._write_model(outfile,'ppor'); self._write_unparsed(outfile,'ppor')
-        if self.cond: self._write_macro(outfile,'cond'); self._write_unparsed(outfile,'cond')
+        if self.cond: self._write_section(outfile,'cond',self._write_macro,'cond'); self._write_unparsed(outfile,'cond')
         if self.vconlist: self._write_model(outfile,'vcon'); self._write_unparsed(outfile,'vcon')
         if self.rlplist: self._write_model(outfile,'rlp'); self._write_unparsed(outfile,'rlp')		
         if self.rlpmlist: self._write_rlpm(outfile); self._write_unparsed(outfile,'rlpm')		
-        if self.time: self._write_time(outfile); self._write_unparsed(outfile,'time')
-        if self.ctrl: self._write_ctrl(outfile); self._write_unparsed(outfile,'ctrl')
-        if self.iter: self._write_iter(outfile); self._write_unparsed(outfile,'iter')
+        if self.time: self._write_section(outfile,'time',self._write_time); self._write_unparsed(outfile,'time')
+        if self.ctrl: self._write_section(outfile,'ctrl',self._write_ctrl); self._write_unparsed(outfile,'ctrl')
+        if self.iter: self._write_section(outfile,'iter',self._write_iter); self._write_unparsed(outfile,'iter')
         if self.carb.iprtype!=0: self._write_carb(outfile); self._write_unparsed(outfile,'carb')
         if self.strs.param['ISTRS']: self._write_strs(outfile); self._write_unparsed(outfile,'strs')
         if self.trac._on: self._write_trac(outfile); self._write_unparsed(outfile,'trac')
@@ -3182,6 +3385,84 @@ class fdata(object):						#FEHM data file.
             nd._elements = [el._index for el in nd._elements]
         for con in self.grid.connlist:
             con._nodes = [con._nodes[0]._index,con._nodes[1]._index]
+    def save(self,filename):
+        """Save the model to a compact binary archive, restored using load(). Grid and node data are stored as arrays, and the 
+        model is not modified (c.f. picklable()).
+        
+        :param filename: Name of archive file.
+        :type filename: str
+        """
+        outfile = open(filename,'wb')
+        pickle.dump(self.grid._to_arrays(),outfile,pickle.HIGHEST_PROTOCOL)
+        _archive_pickler(outfile,self).dump((self._model_state(),self.grid._node_properties()))
+        outfile.close()
+    def load(self,filename):
+        """Load a model from an archive written by save().
+        
+        :param filename: Name of archive file.
+        :type filename: str
+        """
+        if not os.path.isfile(filename): 
+            pyfehm_print('ERROR: cannot find archive \''+filename+'\'.',self._silent)
+            return
+        infile = open(filename,'rb')
+        grid = fgrid()
+        grid._from_arrays(pickle.load(infile))
+        state,node_data = _archive_unpickler(infile,self,grid).load()
+        infile.close()
+        self.__setstate__(state)
+        grid._parent = self
+        grid._set_node_properties(node_data)
+        return self
+    def clone(self):
+        """Return a copy of the model, e.g., for generating ensembles. Zones, macros, boundary conditions, initial conditions and 
+        other parameters are copied. The grid (nodes, elements, connections and spatial index) is shared with this model until either
+        model modifies it (e.g., read(), add_node(), rotate()), at which point that model takes its own copy. Node properties belong to 
+        each model: a node is copied the first time properties are assigned to it (e.g., adding a macro, setting zone permeability or 
+        reading initial conditions), so only the nodes affected are copied. Input files written by each model are independent.
+        
+        :returns: fdata object.
+        """
+        buffer = BytesIO()
+        _archive_pickler(buffer,self).dump(self._model_state())
+        buffer.seek(0)
+        model = fdata.__new__(fdata)
+        grid = self.grid._share()
+        model.__setstate__(_archive_unpickler(buffer,model,grid).load())
+        grid._parent = model
+        return model
+    def _model_state(self):						#Model state for archiving and cloning, without cached or derived data.
+        state = self.__getstate__()
+        state['_vtk'] = None
+        state['_section_cache'] = {}
+        state['_written_files'] = {}
+        state['_monitor'] = None
+        return state
+    def _replace_nodes(self,new_nodes):			#Replace references to grid nodes held by the model, new_nodes maps id(old node) to new node.
+        skip = (fgrid,fnode,felem,fconn,octree)
+        visited = set()
+        def replace(value):			# lists and dicts holding old nodes are copied, not modified, as they may be shared
+            if isinstance(value,fnode): return new_nodes.get(id(value),value)
+            if isinstance(value,list):
+                new = [replace(v) for v in value]
+                if any([vn is not v for vn,v in zip(new,value)]): return new
+            elif isinstance(value,dict):
+                new = dict([(k,replace(v)) for k,v in value.items()])
+                if any([new[k] is not value[k] for k in value]): return new
+            elif type(value).__module__ in ['fdata','fpost','ftool','fvars','fhelp'] and not isinstance(value,skip):
+                if id(value) in visited: return value
+                visited.add(id(value))
+                names = list(getattr(value,'__dict__',{}).keys())
+                for cls in type(value).__mro__:
+                    slots = getattr(cls,'__slots__',[])
+                    if isinstance(slots,str): slots = [slots]
+                    names += [name for name in slots if hasattr(value,name)]
+                for name in names: 
+                    attr = getattr(value,name)
+                    new = replace(attr)
+                    if new is not attr: setattr(value,name,new)
+            return value
+        replace(self)
     def _add_boundary_zones(self): 						#Automatically creates zones corresponding to x,y,z boundaries
         x0,x1 = self.grid.xmin,self.grid.xmax
         y0,y1 = self.grid.ymin,self.grid.ymax
@@ -3242,6 +3523,7 @@ class fdata(object):						#FEHM data file.
             pyfehm_print('ERROR: Unrecognized grid dimensionality',self._silent)
     def _associate_incon(self):							#Associates initial condition data with nodes
         if not self._associate: return
+        self.grid._own_nodes(self.grid.nodelist) 		# node properties not shared with clones
         names = ('T','P','S','S_co2l','S_co2g','co2aq')
         vars = [self.incon.T,self.incon.P,self.incon.S,self.incon.S_co2l,
             self.incon.S_co2g,self.incon.co2aq]
@@ -3279,6 +3561,45 @@ class fdata(object):						#FEHM data file.
             for line in block:
                 if key == 'start': line = '# '+line
                 outfile.write(line)
+    def _write_section(self,outfile,key,writer,*args):			#Writes a section, reusing text from the last write if unchanged.
+        signature = self._section_signature(key)
+        if signature is not None and key in self._section_cache:
+            old_signature,text = self._section_cache[key]
+            if signature == old_signature:
+                outfile.write(text)
+                return
+        buffer = StringIO()
+        writer(buffer,*args)
+        text = buffer.getvalue()
+        outfile.write(text)
+        # writers may tidy up the data (sorting, type conversion), so take signature after writing
+        signature = self._section_signature(key)
+        if signature is None: self._section_cache.pop(key,None)
+        else: self._section_cache[key] = (signature,text)
+    def _section_signature(self,key):							#Returns digest of data written to a section, None if section cannot be cached.
+        def zone_signature(zn):
+            if isinstance(zn,fzone): return (zn.index,zn.name,zn.type,zn.file,zn.points)
+            elif isinstance(zn,list): return [zone_signature(zni) for zni in zn]
+            else: return zn
+        # sections that write out external files cannot be cached
+        if key == 'zone':
+            if any([zn.file for zn in self.zonelist]): return None
+            items = [zone_signature(zn) for zn in self.zonelist]
+        elif key in ['time','ctrl','iter']:
+            items = [sorted(getattr(self,key).items())]
+            if key == 'time': items.append(self.times)
+        else:
+            items = [self.sticky_zones]
+            for macro in self._allMacro[key]:
+                if macro.file: return None
+                if self.sticky_zones:
+                    zns = macro.zone if isinstance(macro.zone,list) else [macro.zone]
+                    if any([isinstance(zn,fzone) and zn.file for zn in zns]): return None
+                items.append((zone_signature(macro.zone),sorted(macro.param.items()),macro.subtype,macro._write_one_macro))
+        for general in self._general_macrolist:
+            if general.insert_after == key:
+                items.append((general.lines,[zone_signature(zn) for zn in general.zonelist]))
+        return content_hash(*items)
     def _read_adif(self,infile):							#ADIF: Reads ADIF macro.
         line = infile.readline().strip().split()
         self.adif = float(line[0])
@@ -4738,7 +5059,7 @@ class fdata(object):						#FEHM data file.
                 # write out macro lines
                 for line in general.lines:
                     outfile.write(line.rstrip()+'\n')
-    def run(self,input='',grid = '',incon='',exe=dflt.fehm_path,files=dflt.files,verbose = None, until=None,autorestart=0,use_paths=False,no_paths = False,write_files_only = False, clean = False, writeSubFiles=True):
+    def run(self,input='',grid = '',incon='',exe=dflt.fehm_path,files=dflt.files,verbose = None, until=None,autorestart=0,use_paths=False,no_paths = False,write_files_only = False, clean = False, writeSubFiles=True, cache=None):
         '''Run an fehm simulation. This command first writes out the input file, *fehmn.files* and this incon file
         if changes have been made. A command line call is then made to the FEHM executable at the specified path (defaults
         to *fehm.exe* in the working directory if not specified).
@@ -4753,7 +5074,7 @@ class fdata(object):						#FEHM data file.
         :type exe: str
         :param files: List of additional files to output. Options include 'check', 'hist' and 'outp'.
         :type files: lst[str]
-        :param until: Name of a function defined inside the script. The function returns a boolean indicating the simulation should be halted. See tutorial 4 for usage.
+        :param until: Name of a function defined inside the script. The function returns a boolean indicating the simulation should be halted. It is called each time FEHM writes new output, after the restart file has been read into the model; new output is described by the :attr:`monitor` attribute. See tutorial 4 for usage.
         :type until: func
         :param autorestart: Number of times FEHM should restart itself in attempting to find a solution.
         :type autorestart: int
@@ -4765,6 +5086,8 @@ class fdata(object):						#FEHM data file.
         :type clean: bool
         :param writeSubFiles: Write out subfiles when running
         :type clean: bool
+        :param cache: Cache of simulation output. If an identical simulation has completed before, its output is restored instead of running FEHM.
+        :type cache: fcache
         '''
         
         if verbose != None: self._verbose = verbose
@@ -4794,18 +5117,33 @@ class fdata(object):						#FEHM data file.
         self.files.input = self._path.filename
         # 1. Copy everything to working directory 
         if not use_paths:
-            self.grid.write(wd+self.grid._path.filename)	# SOMETIMES write grid file
-            self.files.grid = wd+self.grid._path.filename
+            gridpath = wd+self.grid._path.filename
+            signature = self.grid._content_signature()
+            if not self._unchanged_file(gridpath,signature):	# SOMETIMES write grid file
+                if not _link_master_file(gridpath,signature): 		# or link to identical grid file written for another run
+                    self.grid.write(gridpath)
+                    _master_files[(os.path.splitext(gridpath)[1].lower(),signature)] = (gridpath,os.path.getmtime(gridpath))
+                self._record_file(gridpath,signature)
+            self.files.grid = gridpath
             if self.files._use_incon:
-                self.incon.write(wd+self.incon._path.filename)	# SOMETIMES write incon file
-                self.files.incon = wd+self.incon._path.filename
+                inconpath = wd+self.incon._path.filename
+                signature = self.incon._content_signature()
+                if not self._unchanged_file(inconpath,signature):	# SOMETIMES write incon file
+                    self.incon.write(inconpath)
+                    self._record_file(inconpath,signature)
+                self.files.incon = inconpath
             if self.files._use_stor:						# SOMETIMES copy stor file
                 temp_path = fpath()
                 temp_path.filename = self.files.stor
                 if os.path.isfile(temp_path.full_path):
-                    try:
-                        shutil.copy(temp_path.full_path,wd+temp_path.filename)
-                    except: pass
+                    storpath = wd+temp_path.filename
+                    stat = os.stat(temp_path.full_path)
+                    signature = (temp_path.full_path,stat.st_size,stat.st_mtime)
+                    if not (os.path.isfile(storpath) and os.path.samefile(temp_path.full_path,storpath)) and not self._unchanged_file(storpath,signature):
+                        try:
+                            _link_or_copy(temp_path.full_path,storpath)
+                            self._record_file(storpath,signature)
+                        except: pass
                 else:
                     pyfehm_print('ERROR: cant find stor file at '+temp_path.full_path,self._silent)
                     return
@@ -4830,6 +5168,12 @@ class fdata(object):						#FEHM data file.
         self.files.write()				# ALWAYS write fehmn.files
         if write_files_only: return 		# return here if user requests only write out of files
         self.files.exe = exe
+        if cache is not None: 			# identical simulation already run?
+            key = cache._key(self,wd,exe_path.full_path)
+            if cache._restore(key,wd):
+                pyfehm_print('Simulation output restored from '+cache.directory,self._silent)
+                return
+            snapshot = cache._snapshot(wd)
         # RUN SIMULATION
         cwd = os.getcwd()
                 
@@ -4859,16 +5203,23 @@ class fdata(object):						#FEHM data file.
             else:
                 p = Popen(exe_path.full_path.split())
                 self._running = True
+                self._monitor = _run_monitor(self)
+                wait = dflt.sleep_time_min
                 while self._running:					# loop for checking if stop condition is met
-                    sleep(dflt.sleep_time) 					# wait 
-                    untilFlag = until(self) 		
+                    sleep(wait) 					# wait 
                     p.poll() 						# check if run finished on its own
-                    if p.returncode == 0:					# IF run finshed on its own
+                    if p.returncode is not None:					# IF run finshed on its own
                         self._running = False					# break the loop
-                    if untilFlag and self._running: 		# IF stop condition met
-                        p.terminate()							# kill the process
-                        self._running = False					# break the loop
-                        breakAutorestart = True
+                    elif self._monitor.check(): 			# IF new output, read it and check stop condition
+                        wait = dflt.sleep_time_min
+                        untilFlag = until(self) 		
+                        if untilFlag: 		# IF stop condition met
+                            p.terminate()							# kill the process
+                            self._monitor.kill_latency = time()-self._monitor.output_time
+                            self._running = False					# break the loop
+                            breakAutorestart = True
+                    else: 							# back off while no new output
+                        wait = min(2*wait,dflt.sleep_time)
 
             if autorestart != 0:
                 self.incon.read(self.files.rsto)        # read fin file for autorestart
@@ -4882,7 +5233,150 @@ class fdata(object):						#FEHM data file.
             try: os.remove('fort.97')
             except: pass
         
+        if cache is not None and until is None and autorestart == 0: 		# cache output of completed simulation
+            rsto = self.files.rsto
+            if not os.path.isabs(rsto): rsto = wd+rsto
+            if os.path.isfile(rsto) and snapshot.get(os.path.split(rsto)[-1]) != os.path.getmtime(rsto): cache._store(key,wd,snapshot)
+        
         if self.work_dir: os.chdir(cwd)
+    async def run_async(self,input='',grid='',incon='',exe=dflt.fehm_path,files=dflt.files,verbose=None,until=None,log=None,callback=None,
+        use_paths=False,clean=False):
+        '''Coroutine version of :meth:`run`, to be awaited from an asyncio event loop. FEHM screen output is read line by line as it
+        is produced and passed to a log file and callback function. As for :meth:`run`, the stop condition is checked only when output 
+        files change (see :attr:`monitor`). Writing input files, reading output and the stop condition run in a thread pool, not in the 
+        event loop, so many simulations (with different work directories) can be run concurrently, e.g., using asyncio.gather().
+        
+        :param input: Name of input file. This will be written out.
+        :type input: str
+        :param grid: Name of grid file. This will be written out.
+        :type grid: str
+        :param incon: Name of restart file.
+        :type incon: str
+        :param exe: Path to FEHM executable.
+        :type exe: str
+        :param files: List of additional files to output. Options include 'check', 'hist' and 'outp'.
+        :type files: lst[str]
+        :param verbose: Print FEHM output to screen.
+        :type verbose: bool
+        :param until: Function that takes the fdata object and returns a boolean indicating the simulation should be halted.
+        :type until: func
+        :param log: Name of file (in the work directory, if relative) to which FEHM screen output is written.
+        :type log: str
+        :param callback: Function called with each line of FEHM screen output and the stream it came from ('stdout' or 'stderr').
+        :type callback: func
+        :param use_paths: Flag to indicate that PyFEHM should favour full paths in fehmn.files rather than duplication of source files.
+        :type use_paths: bool
+        :param clean: Delete files after simulation 'nop.temp'
+        :type clean: bool
+        :returns: Return code of the FEHM executable (negative if halted by the stop condition).
+        '''
+        if verbose != None: self._verbose = verbose
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None,lambda: self.run(input=input,grid=grid,incon=incon,exe=exe,files=files,use_paths=use_paths,write_files_only=True))
+        exe_path = fpath()
+        exe_path.filename = exe
+        if self.work_dir: wd = self.work_dir
+        else: wd = os.getcwd()
+        
+        # remove restart file if left over from old simulation
+        rsto = self.files.rsto
+        if not os.path.isabs(rsto): rsto = wd+os.sep+rsto
+        if until and self.incon.time == None and os.path.isfile(rsto): os.remove(rsto)
+        
+        logfile = None
+        if log:
+            if not os.path.isabs(log): log = wd+os.sep+log
+            logfile = open(log,'w')
+        if until: self._monitor = _run_monitor(self,wd)
+        p = await asyncio.create_subprocess_exec(*exe_path.full_path.split(),cwd=wd,stdout=asyncio.subprocess.PIPE,stderr=asyncio.subprocess.PIPE)
+        self._running = True
+        async def stream(reader,name):
+            while True:
+                line = await reader.readline()
+                if not line: break
+                line = line.decode('utf-8',errors='replace')
+                if logfile: logfile.write(line)
+                if self._verbose: sys.stdout.write(line)
+                if callback: callback(line,name)
+        async def watch(): 			# check stop condition when output files change, backing off while no new output
+            wait = dflt.sleep_time_min
+            while self._running and p.returncode is None:
+                await asyncio.sleep(wait)
+                if not await loop.run_in_executor(None,self._monitor.check):
+                    wait = min(2*wait,dflt.sleep_time)
+                    continue
+                wait = dflt.sleep_time_min
+                if await loop.run_in_executor(None,until,self): 	# stop condition met
+                    self._running = False
+                    try: p.terminate()
+                    except ProcessLookupError: pass 			# already finished
+                    self._monitor.kill_latency = time()-self._monitor.output_time
+        watcher = asyncio.ensure_future(watch()) if until else None
+        await asyncio.gather(stream(p.stdout,'stdout'),stream(p.stderr,'stderr'))
+        returncode = await p.wait()
+        self._running = False
+        if watcher: await watcher
+        if logfile: logfile.close()
+        
+        if clean:
+            for file in ['nop.temp','fort.97']:
+                try: os.remove(wd+os.sep+file)
+                except: pass
+        return returncode
+    def run_stages(self,stages,exe=dflt.fehm_path,files=dflt.files,verbose=None,clean=False):
+        '''Run a sequence of simulations, each restarting from the final state of the previous one (e.g., spin-up, injection, shut-in).
+        The restart file produced by each stage is read as arrays only and passed to the next stage as its initial conditions, without 
+        reassigning values to grid nodes. Node values are updated once, after the final stage.
+        
+        :param stages: List of stages, in order. Each stage is a function that takes the fdata object and makes changes for that stage (e.g., boundary conditions, end time), or a tuple (name, function). Use None for no changes.
+        :type stages: lst
+        :param exe: Path to FEHM executable.
+        :type exe: str
+        :param files: List of additional files to output. Options include 'check', 'hist' and 'outp'.
+        :type files: lst[str]
+        :param verbose: Print FEHM output to screen.
+        :type verbose: bool
+        :param clean: Delete files after simulation 'nop.temp'
+        :type clean: bool
+        :returns: List of dictionaries, one per stage, giving stage name and wall times (s) for setup, run and restart read.
+        '''
+        if self.work_dir: wd = self.work_dir + os.sep
+        else: wd = os.getcwd() + os.sep
+        if self._path.filename is None: self._path.filename = 'input.dat'
+        root = self._path.filename.split('.')[0]
+        timing = []
+        for i,stage in enumerate(stages):
+            if isinstance(stage,tuple): name,setup = stage
+            else: name,setup = 'stage'+str(i+1),stage
+            t0 = time()
+            if setup is not None: setup(self)
+            t1 = time()
+            self.files.rsto = root+'_'+name+'.fin'
+            rsto = self.files.rsto
+            if not os.path.isabs(rsto): rsto = wd+rsto
+            if os.path.isfile(rsto): os.remove(rsto)
+            self.run(exe=exe,files=files,verbose=verbose,clean=clean)
+            t2 = time()
+            if not os.path.isfile(rsto):
+                pyfehm_print('ERROR: stage '+name+' did not produce restart file '+rsto,self._silent)
+                return timing
+            # hand restart data to next stage without assigning to nodes, reuse FEHM file rather than rewriting
+            self.incon.read(rsto,associate=False)
+            inconname = root+'_'+name+'.ini'
+            shutil.copy(rsto,wd+inconname)
+            self.incon._path.filename = inconname
+            self.files.incon = wd+inconname
+            self._record_file(wd+inconname,self.incon._content_signature())
+            t3 = time()
+            timing.append({'stage':name,'setup':t1-t0,'run':t2-t1,'restart':t3-t2})
+            pyfehm_print('Stage '+name+': run '+'%.2f'%(t2-t1)+' s, restart '+'%.2f'%(t3-t2)+' s.',self._silent)
+        self._associate_incon()
+        return timing
+    def _unchanged_file(self,path,signature):			#True if file at path was last written by run() with same content and not since modified.
+        if not os.path.isfile(path) or path not in self._written_files: return False
+        return self._written_files[path] == (signature,os.path.getmtime(path))
+    def _record_file(self,path,signature):
+        if os.path.isfile(path): self._written_files[path] = (signature,os.path.getmtime(path))
     def paraview(self,exe = dflt.paraview_path,filename = 'temp.vtk',contour = None, history = None, show='kx',zones = 'none',diff = True,zscale = 1.,
         spatial_derivatives = False, time_derivatives = False, nodes = False, wells = None):
         '''Exports the model object to VTK and loads in paraview.
@@ -5163,7 +5657,7 @@ class fdata(object):						#FEHM data file.
             checkWarnings = []
             buildWarnings = []
         return False
-    def temperature_gradient(self,filename,offset=0.,first_zone = 100,auxiliary_file=None,hydrostatic = 0,flip_depth_sign=False):
+    def temperature_gradient(self,filename,offset=0.,first_zone = 100,auxiliary_file=None,hydrostatic = 0,flip_depth_sign=False,incon=None):
         '''Assign initial temperature distribution to model based on supplied temperature profile.
         
         :param filename: Name of a file containing temperature gradient data. File should be two columns, comma or space separated, with elevation in the first column and temperature (degC) in the second.
@@ -5178,6 +5672,8 @@ class fdata(object):						#FEHM data file.
         :type hydrostatic: fl64
         :param flip_depth_sign: If sign of depths in file does not match z coordinate in simulation, flip the sign.
         :type flip_depth_sign: bool
+        :param incon: Name of restart file to which node temperatures, pressures and saturations are written. If supplied, initial conditions are assigned to every node through the restart file instead of **PRES** macros.
+        :type incon: str
         '''
         # check if file exists
         if not os.path.isfile(filename): 
@@ -5211,8 +5707,27 @@ class fdata(object):						#FEHM data file.
         else:
             p0 = 1.
             _buildWarnings('WARNING: no pressure information, assigning default of 1 MPa. These pressures will be overwritten if GRAD macro used.')
-        # assign zones or nodes
-        if zoneFlag:
+        # assign restart file, zones or nodes
+        if incon:
+            znd = np.array([nd.position[2] for nd in self.grid.nodelist])
+            T = np.interp(znd,np.sort(zt),tt[np.argsort(zt)])
+            if hydrostatic != 0:
+                depths = np.unique(abs(znd))
+                P = fluid_column(depths,Tgrad = filename, Tsurf = 25., Psurf = hydrostatic)[0][:,0]
+                if depths[0] != 0: depths = np.concatenate([[0.],depths]) 	# fluid_column prepends surface
+                P = np.interp(abs(znd),depths,P)
+            else:
+                P = p0*np.ones(len(znd))
+            self.incon._T = T
+            self.incon._P = P
+            self.incon._S = np.ones(len(znd))
+            if self.incon.time is None: self.incon._time = float0(self.ti)
+            if not self.incon.source: self.incon._source = filename
+            self.incon._path.filename = incon
+            self.incon._writeOut = True
+            self.files.incon = incon
+            self._associate_incon()
+        elif zoneFlag:
             ind = first_zone
             x0,x1 = self.grid.xmin,self.grid.xmax
             y0,y1 = self.grid.ymin,self.grid.ymax
@@ -5790,11 +6305,13 @@ class fdata(object):						#FEHM data file.
     def _associate_macro(self,macro):							#Associates macro properties with nodes
         if not self._associate: return
         if isinstance(macro.zone,list):
+            self.grid._own_nodes([nd for zn in macro.zone for nd in zn.nodelist]) 		# node properties not shared with clones
             for zn in macro.zone:
                 for nd in zn.nodelist:	
                     if macro.type =='rlp': nd._rlpmodel = macro.index
                     elif macro.type =='permmodel': nd._permmodel = macro.index
         elif isinstance(macro.zone,tuple):
+            self.grid._own_nodes([macro.zone[0]])
             nd = self.grid.node[macro.zone[0]]
             if macro.type == 'pres':
                 if macro.param['saturation'] == 1:
@@ -5827,6 +6344,7 @@ class fdata(object):						#FEHM data file.
         elif isinstance(macro.zone,fzone) or isinstance(macro.zone,int) or isinstance(macro.zone,str):
             zn = macro.zone
             if isinstance(macro.zone,int) or isinstance(macro.zone,str): zn = self.zone[zn]
+            self.grid._own_nodes(zn.nodelist)
             for nd in zn.nodelist:	
                 # add generator properties
                 if macro.type =='flow':
@@ -5887,7 +6405,7 @@ class fdata(object):						#FEHM data file.
         filemacros = []
         textmacros = []
         singlemacros = []
-        self._allMacro[macroName].sort(key=lambda x: x.zone.index)
+        self._allMacro[macroName].sort(key=_macro_sort_key)
         keys = [k for k,nul in macro_list[macroName]]
         for macro in self._allMacro[macroName]:
             # check no additional parameters defined
@@ -5921,6 +6439,7 @@ class fdata(object):						#FEHM data file.
             #for macro in self._allMacro[macroName]:
             for macro in textmacros:
                 if macro.zone == 0: macro.zone = self.zone[0]
+            for zn,macro in self._macro_zone_runs(textmacros,macroName):
                 if printToFile:
                     if macro.file != - 1: continue
                 elif macro.file: continue
@@ -5934,7 +6453,6 @@ class fdata(object):						#FEHM data file.
                         else: outfile.write('\n')									  #^
                 #^^^^^^^^^^^^^^^^^^^^^^^^^^^ end exception ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
                 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-                zn = macro.zone
                 if isinstance(zn,tuple):
                     outfile.write(str(zn[0])+'\t'+str(zn[1])+'\t'+str(zn[2])+'\t')
                 else:
@@ -6029,6 +6547,41 @@ class fdata(object):						#FEHM data file.
                     macrofile.close()
         self._write_general_macro(outfile, macroName)
         return True
+    def _macro_zone_runs(self,macros,macroName):				#Pairs macros with zones to write, merging single node macros into node ranges.
+        # exceptions for grad and stressboun, which depend on one line per macro
+        if macroName in ['grad','stressboun']: return [(macro.zone,macro) for macro in macros]
+        runs = []
+        block = []
+        def merge_block():
+            nodes = [macro.zone[0] for macro in block]
+            if len(set(nodes)) != len(nodes):		# node assigned more than once, order matters so write as is
+                runs.extend([(macro.zone,macro) for macro in block])
+                return
+            # group nodes with identical parameters, then split each group into JA JB JC ranges
+            groups = {}
+            params = []
+            for macro in block:
+                param = (macro.file,)+tuple([str(macro.param[key]) for key,nul in macro_list[macroName]])		# only merge macros written to the same file
+                if param not in groups: groups[param] = []; params.append(param)
+                groups[param].append(macro)
+            for param in params:
+                group = sorted(groups[param],key=lambda x: x.zone[0])
+                i = 0
+                while i < len(group):
+                    if i+1 == len(group):
+                        runs.append((group[i].zone,group[i])); break
+                    stride = group[i+1].zone[0] - group[i].zone[0]
+                    j = i+1
+                    while j+1 < len(group) and group[j+1].zone[0] - group[j].zone[0] == stride: j += 1
+                    runs.append(((group[i].zone[0],group[j].zone[0],stride),group[i]))
+                    i = j+1
+        for macro in macros:
+            if isinstance(macro.zone,tuple) and macro.zone[0] == macro.zone[1]: 
+                block.append(macro); continue
+            if block: merge_block(); block = []
+            runs.append((macro.zone,macro))
+        if block: merge_block()
+        return runs
     def _get_macro(self,macro):									#Constructs macro lists and dictionaries
         tempDict = []
         for macro in self._allMacro[macro]:
@@ -6400,6 +6953,8 @@ class fdata(object):						#FEHM data file.
             elif value == 0: value = False
         self._verbose = value
     verbose = property(_get_verbose,_set_verbose)#: (*bool*) Boolean signalling if simulation output to be printed to screen.
+    def _get_monitor(self): return self._monitor
+    monitor = property(_get_monitor) #: (*_run_monitor*) Output files watched while running with a stop condition: files changed since the last check (changed), text appended to them (new_text), time of the output (output_time) and delay between output and halting the simulation (kill_latency).
     def _get_sticky_zones(self): return self._sticky_zones
     def _set_sticky_zones(self,value): self._sticky_zones = value
     sticky_zones = property(_get_sticky_zones, _set_sticky_zones) #: (*bool*) If ``True`` zone definitions will be written to the input file immediately before they are used inside a macro.
@@ -6539,3 +7094,78 @@ class fdata(object):						#FEHM data file.
     
     
     
+def run_ensemble(models,exe=dflt.fehm_path,work_dir='ensemble',processes=None,names=None,files=dflt.files,timeout=None):
+    '''Run an ensemble of FEHM simulations in parallel. Each model is given its own work directory, in which its input files are
+    written and the FEHM executable is run. Input files for one model are written while others are running, and at most *processes*
+    simulations run at any one time. Screen output from each simulation is written to *fehm.log* in its work directory.
+    
+    :param models: Models to run. If a generator is given, models are created only as simulations finish and make room for them.
+    :type models: lst[fdata]
+    :param exe: Path to FEHM executable.
+    :type exe: str
+    :param work_dir: Directory in which model work directories are created.
+    :type work_dir: str
+    :param processes: Maximum number of simulations to run at once (defaults to the number of processors).
+    :type processes: int
+    :param names: Work directory name for each model (defaults to 'run1', 'run2', ...).
+    :type names: lst[str]
+    :param files: List of additional files to output. Options include 'check', 'hist' and 'outp'.
+    :type files: lst[str]
+    :param timeout: Time (s) after which a simulation is terminated.
+    :type timeout: float
+    :returns: List of dictionaries, one per model in the order given, with keys 'name', 'work_dir', 'returncode', 'time' (wall time, s), 'log' (path to screen output), 'rsto' (path to restart file, None if not produced) and 'error' (None if successful).
+    '''
+    exe_path = fpath()
+    exe_path.filename = exe
+    if not os.path.isfile(exe_path.full_path):
+        if not os.path.isfile(exe_path.full_path.split()[-1]):
+            raise NameError('No executable at location '+exe)
+    if processes is None: processes = os.cpu_count() or 1
+    work_dir = os.path.abspath(work_dir)
+    
+    pool = ThreadPoolExecutor(max_workers=processes)
+    futures = []
+    running = set()
+    for i,model in enumerate(models):
+        if len(running) >= processes: 			# wait for a free slot before taking next model from a generator
+            done,running = wait(running,return_when=FIRST_COMPLETED)
+        if names: name = names[i]
+        else: name = 'run'+str(i+1)
+        futures.append(pool.submit(_run_ensemble_member,model,name,work_dir+os.sep+name,exe_path.full_path,files,timeout))
+        running.add(futures[-1])
+    pool.shutdown(wait=True)
+    
+    results = [future.result() for future in futures]
+    failed = [result['name'] for result in results if result['error']]
+    if failed: pyfehm_print('ERROR: '+str(len(failed))+' of '+str(len(results))+' simulations failed: '+', '.join(failed),dflt.silent)
+    return results
+def _run_ensemble_member(model,name,wd,exe,files,timeout):	#Write and run one model of an ensemble in its own directory.
+    result = {'name':name,'work_dir':wd,'returncode':None,'time':0.,'log':wd+os.sep+'fehm.log','rsto':None,'error':None}
+    t0 = time()
+    try:
+        if not os.path.isdir(wd): os.makedirs(wd)
+        model.work_dir = wd
+        model.run(exe=exe,files=files,write_files_only=True) 		# no chdir, so safe alongside other models
+        if not os.path.isfile(wd+os.sep+'fehmn.files'):
+            result['error'] = 'input files not written'
+            return result
+        rsto = model.files.rsto
+        if not os.path.isabs(rsto): rsto = wd+os.sep+rsto
+        if os.path.isfile(rsto): os.remove(rsto)
+        log = open(result['log'],'w')
+        p = Popen(exe.split(),cwd=wd,stdout=log,stderr=STDOUT)
+        try:
+            p.wait(timeout=timeout)
+        except TimeoutExpired:
+            p.terminate()
+            p.wait()
+            result['error'] = 'timed out after '+str(timeout)+' s'
+        log.close()
+        result['returncode'] = p.returncode
+        if os.path.isfile(rsto): result['rsto'] = rsto
+        if p.returncode != 0 and not result['error']: result['error'] = 'return code '+str(p.returncode)
+    except Exception as e:
+        result['error'] = repr(e)
+    finally:
+        result['time'] = time()-t0
+    return result
@@ -85,6 +85,7 @@ class fdflt(object):
         self.sticky_zones             =     True        # print zone definitions immediately before use in input file
         self.full_connectivity         =    True    
         self.sleep_time             =     1.
+        self.sleep_time_min         =     0.05      # shortest wait between checks for new output when running with a stop condition
         self.keep_unknown             =     True         # set true if PyFEHM should preserve unknown macros in future output files
         self.silent                 =    False        # turns off all PyFEHM verbiage
         
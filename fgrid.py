@@ -35,6 +35,11 @@ try:
 	from scipy import spatial as spsp
 except ImportError:
 	'placeholder'
+try:
+	from multiprocessing import shared_memory
+except ImportError:
+	'placeholder'
+import json
 	
 from fpost import*
 from ftool import*
@@ -128,6 +133,12 @@ class fnode(object):				#Node object.
 	def __setstate__(self, data_dict):
 		for (name, value) in data_dict.items():
 			setattr(self, name, value)
+	def _copy(self):			#Copy of node with its own properties, sharing position and connectivity.
+		new = fnode.__new__(fnode)
+		for attr in fnode.__slots__: setattr(new,attr,getattr(self,attr))
+		new._zone = dict(self._zone); new._generator = dict(self._generator)
+		new._connections = list(self._connections); new._elements = list(self._elements)
+		return new
 	def _get_index(self): return self._index
 	index = property(_get_index) #: (*int*) Integer number denoting the node.	
 	def _get_position(self): return self._position
@@ -471,6 +482,7 @@ class octree(object):				#Octree object.
 			min_cube = self
 		#print min_cube.elements[0].index, ' ', min_dist
 		return min_dist,min_cube
+_attached_data = ['_nodelist','_node','_connlist','_conn','_elemlist','_elem']
 class fgrid(object):				#Grid object.
 	""" FEHM grid object.
 	
@@ -488,6 +500,21 @@ class fgrid(object):				#Grid object.
 		self._full_connectivity = full_connectivity
 		self._path = fpath(parent=self)		
 		self._pos_matrix = None
+		self._shared = False 		# node, element and connection data shared with another grid, copied on modification
+		self._nodes_shared = False 	# node objects shared with another grid, copied before their positions or properties change
+		self._copied = set() 		# ids of nodes copied from a shared grid, see _own_nodes()
+		self._shm = None 			# shared memory block holding grid data, see publish() and attach()
+		self._shm_owner = False
+		self._attached = None 		# arrays on shared memory from which node, element and connection objects are built when first needed
+	def __getattr__(self,name):		# called only for missing attributes, i.e., node, element and connection data of attached grid not yet built
+		if name in _attached_data and self.__dict__.get('_attached') is not None:
+			arrays,props = self._attached
+			self._attached = None
+			self._from_arrays(arrays)
+			self._set_node_properties(props)
+			self._shared = True 		# data still on shared memory
+			return getattr(self,name)
+		raise AttributeError(name)
 	def __repr__(self): 
 		if self.filename == None:
 			return 'no grid'
@@ -501,6 +528,7 @@ class fgrid(object):				#Grid object.
 		:param full_connectivity: read element and connection data and construct corresponding objects. Defaults to False. Use if access to connectivity information will be useful.
 		:type full_connectivity: bool
 		"""
+		self._unshare()
 		self._full_connectivity = full_connectivity
 		self._path.filename = gridfilename 
 		if not os.path.isfile(gridfilename):
@@ -701,6 +729,7 @@ class fgrid(object):				#Grid object.
 			else:
 				path = self._path.full_path
 		
+		if os.path.isfile(path): os.remove(path) 		# may be hard linked to other runs' grid files, see fdata.run()
 		outfile = open(path,'w')
 		
 		if format == 'fehm': self._write_fehm(outfile)
@@ -712,6 +741,209 @@ class fgrid(object):				#Grid object.
 			self._path = temp_path
 			self._parent.ctrl['stor_file_LDA'] = 1
 			self._parent.files.stor = path
+	def _content_signature(self):			#Digest of node positions and element connectivity, used to skip unchanged writes.
+		inds = np.array([nd.index for nd in self.nodelist])
+		pos = np.array([nd.position for nd in self.nodelist],dtype=float)
+		if self._full_connectivity:
+			elems = [[nd.index for nd in el.nodes] for el in self.elemlist]
+		else:
+			elems = self.elemlist
+		try: elems = np.array(elems,dtype=int)
+		except ValueError: pass 		# mixed element types
+		return content_hash(inds,pos,elems,self._full_connectivity)
+	def _to_arrays(self):					#Node and element data as arrays, for compact storage.
+		arrays = dict(index = np.array([nd.index for nd in self.nodelist],dtype=int),
+			position = np.array([nd.position for nd in self.nodelist],dtype=float),
+			full_connectivity = self._full_connectivity, dimensions = self._dimensions, filename = self._path.full_path)
+		if self._full_connectivity:
+			arrays['elem_index'] = np.array([el.index for el in self.elemlist],dtype=int)
+			arrays['conn'] = np.array([[con.nodes[0].index,con.nodes[1].index] for con in self.connlist],dtype=int)
+			elems = [[nd.index for nd in el.nodes] for el in self.elemlist]
+		else:
+			arrays['elem_index'] = np.array(list(self._elem.keys()),dtype=int)
+			elems = self.elemlist
+		try: arrays['elem_nodes'] = np.array(elems,dtype=int)
+		except ValueError: arrays['elem_nodes'] = elems 		# mixed element types
+		return arrays
+	def _from_arrays(self,arrays):			#Rebuild nodes and elements from arrays produced by _to_arrays().
+		self._nodelist = []; self._node = {}
+		self._connlist = []; self._conn = {}
+		self._elemlist = []; self._elem = {}
+		self._full_connectivity = arrays['full_connectivity']
+		for ind,pos in zip(arrays['index'].tolist(),arrays['position']):
+			self.add_node(fnode(index=ind,position=pos))
+		for ind,el in zip(arrays['elem_index'].tolist(),arrays['elem_nodes']):
+			el = [int(eli) for eli in el]
+			if self._full_connectivity:
+				new_elem = felem(index = ind, nodes = [self.node[eli] for eli in el])
+				self.add_elem(new_elem)
+				for nd in new_elem.nodes: nd.elements.append(new_elem)
+			else:
+				self._elemlist.append(el)
+				self._elem[ind] = self.elemlist[-1]
+		if self._full_connectivity:		# connections stored explicitly, no need to derive from elements
+			for nd1,nd2 in arrays['conn'].tolist():
+				nd1 = self.node[nd1]; nd2 = self.node[nd2]
+				new_conn = fconn(nodes = [nd1,nd2])
+				self.add_conn(new_conn)
+				nd1.connections.append(new_conn)
+				nd2.connections.append(new_conn)
+		self._dimensions = arrays['dimensions']
+		self._pos_matrix = arrays['position']
+		if arrays['filename']: self._path.filename = arrays['filename']
+	def _node_properties(self,numeric=False):	#Node properties as one array (or list if not numeric) per property.
+		data = {}
+		for attr in fnode.__slots__:
+			if attr in ['_index','_position','_connections','_elements']: continue
+			values = [getattr(nd,attr) for nd in self.nodelist]
+			if all([value is None for value in values]): continue
+			if all([isinstance(value,(int,float,np.number)) for value in values]): data[attr] = np.array(values)
+			elif all([isinstance(value,np.ndarray) and value.shape == np.shape(values[0]) and value.dtype.kind in 'biuf' 
+				for value in values]): data[attr] = np.array(values) 	# e.g., permeability
+			elif not numeric: data[attr] = values
+		return data
+	def _set_node_properties(self,data):		#Assign node properties from _node_properties() output.
+		for attr,values in data.items():
+			if isinstance(values,np.ndarray) and len(values.shape) == 1: values = values.tolist()		# vector properties (e.g., permeability) are row views
+			for nd,value in zip(self.nodelist,values): setattr(nd,attr,value)
+	def node_array(self,name):
+		"""Return node data as an array, ordered as nodelist. For grids constructed by attach(), data held in shared memory is returned 
+		as a read-only view, without constructing node objects. Missing property values are returned as NaN.
+
+		:param name: Node attribute, 'index', 'position' or a node property, e.g., 'density', 'permeability'.
+		:type name: str
+		:returns: ndarray
+		"""
+		if self._attached is not None:
+			arrays,props = self._attached
+			if name in arrays: return arrays[name]
+			if '_'+name in props: return props['_'+name]
+		values = [getattr(nd,'_'+name) for nd in self.nodelist]
+		if name == 'index': return np.array(values,dtype=int)
+		return np.array([np.nan if value is None else value for value in values],dtype=float)
+	def publish(self,name=None):
+		"""Copy node positions, element and connection data, and numeric node properties into shared memory, from where other 
+		processes (e.g., workers in a multiprocessing.Pool) can attach to them by name using attach(). Call unpublish() when all 
+		processes are finished, which removes the shared memory.
+
+		:param name: Name of shared memory block. If not given, a unique name is generated.
+		:type name: str
+		:returns: Name of shared memory block.
+		"""
+		arrays = self._to_arrays()
+		if not isinstance(arrays['elem_nodes'],np.ndarray):
+			print('ERROR: grids with mixed element types cannot be published.'); return
+		for attr,values in self._node_properties(numeric=True).items(): arrays['node'+attr] = values
+		header = dict([(k,arrays.pop(k)) for k in ['full_connectivity','dimensions','filename']])
+		# array data laid out after header, each on 8 byte boundary
+		header['arrays'] = []
+		size = 0
+		for k in list(arrays.keys()):
+			arrays[k] = np.ascontiguousarray(arrays[k])
+			header['arrays'].append([k,size,list(arrays[k].shape),arrays[k].dtype.str])
+			size += int(np.ceil(arrays[k].nbytes/8.))*8
+		head = json.dumps(header).encode()
+		start = int(np.ceil((8+len(head))/8.))*8
+		shm = shared_memory.SharedMemory(name=name,create=True,size=start+size)
+		shm.buf[:8] = np.array([len(head)],dtype=np.int64).tobytes()
+		shm.buf[8:8+len(head)] = head
+		for k,offset,shape,dtype in header['arrays']:
+			np.ndarray(arrays[k].shape,dtype=arrays[k].dtype,buffer=shm.buf,offset=start+offset)[...] = arrays[k]
+		self._shm = shm
+		self._shm_owner = True
+		return shm.name
+	def attach(self,name):
+		"""Construct grid from data placed in shared memory by publish(). Grid data are read-only views on the shared memory, and so are
+		stored once however many processes attach. Node, element and connection objects are constructed only when first accessed, so a 
+		worker that needs only node data (see node_array()) does not construct them. The grid is copied if it is modified (e.g., rotate()).
+		The shared memory stays mapped for as long as the grid exists, so data taken from the grid should not be used after it is released.
+
+		:param name: Name of shared memory block, as returned by publish().
+		:type name: str
+		"""
+		try: shm = shared_memory.SharedMemory(name=name,track=False)
+		except TypeError: shm = shared_memory.SharedMemory(name=name) 		# track keyword from Python 3.13
+		n = int(np.frombuffer(bytes(shm.buf[:8]),dtype=np.int64)[0])
+		header = json.loads(bytes(shm.buf[8:8+n]).decode())
+		start = int(np.ceil((8+n)/8.))*8
+		arrays = dict([(k,header[k]) for k in ['full_connectivity','dimensions','filename']])
+		props = {}
+		for k,offset,shape,dtype in header['arrays']:
+			array = np.ndarray(tuple(shape),dtype=dtype,buffer=shm.buf,offset=start+offset)
+			array.flags.writeable = False 		# changes must not reach other processes
+			if k.startswith('node_'): props[k[4:]] = array
+			else: arrays[k] = array
+		for attr in _attached_data: self.__dict__.pop(attr,None)
+		self._attached = (arrays,props)
+		self._full_connectivity = arrays['full_connectivity']
+		self._dimensions = arrays['dimensions']
+		self._pos_matrix = arrays['position']
+		if arrays['filename']: self._path.filename = arrays['filename']
+		self._octree = None
+		self._shm = shm
+		self._shm_owner = False
+		self._shared = True
+		self._nodes_shared = True 		# node positions are views on shared memory
+		return self
+	def unpublish(self):
+		"""Remove shared memory created by publish(). Called from the publishing process once other processes have finished with it. 
+		Grids constructed by attach() keep the shared memory mapped until they are released, so may still be used; for these, 
+		unpublish() does nothing.
+		"""
+		if self._shm is None or not self._shm_owner: return 		# attached data are views on the shared memory, which must stay mapped
+		self._shm.unlink()
+		self._shm.close() 		# publishing grid holds its own copy of the data
+		self._shm = None
+	def _share(self):						#Return new grid object sharing node, element and connection data with this one.
+		grid = fgrid(full_connectivity=self._full_connectivity)
+		for attr in ['_nodelist','_node','_connlist','_conn','_elemlist','_elem','_octree','_dimensions','_pos_matrix']:
+			setattr(grid,attr,getattr(self,attr))
+		grid._path = copy(self._path)
+		grid._path.parent = grid
+		if not self._shm_owner: grid._shm = self._shm 		# attached shared memory stays mapped while either grid exists
+		grid._shared = True
+		grid._nodes_shared = True
+		self._shared = True
+		self._nodes_shared = True
+		self._copied = set() 		# nodes copied earlier are now shared with the new grid
+		return grid
+	def _unshare(self,deep=False):			#Take own copy of shared data before modification, deep copy if nodes are modified.
+		if not (self._shared or (deep and self._nodes_shared)): return
+		if not deep:
+			self._shared = False
+			self._nodelist = copy(self._nodelist); self._node = copy(self._node)
+			self._connlist = copy(self._connlist); self._conn = copy(self._conn)
+			self._elemlist = copy(self._elemlist); self._elem = copy(self._elem)
+			return
+		self._shared = False
+		self._nodes_shared = False
+		self._copied = set()
+		# new node objects, references held by the parent model (e.g., zones) are moved to these
+		old_nodes = self._nodelist
+		self._from_arrays(self._to_arrays())
+		for old,nd in zip(old_nodes,self._nodelist):
+			for attr in fnode.__slots__:
+				if attr in ['_index','_position','_connections','_elements']: continue
+				value = getattr(old,attr)
+				if isinstance(value,(list,dict)): value = copy(value)
+				setattr(nd,attr,value)
+		self._octree = None
+		if self._parent: self._parent._replace_nodes(dict([(id(old),nd) for old,nd in zip(old_nodes,self._nodelist)]))
+	def _own_nodes(self,nodes):				#Copy nodes shared with another grid (e.g., of a clone) before their properties are assigned.
+		if not self._nodes_shared: return
+		self._unshare()
+		new_nodes = {}
+		for nd in nodes:
+			if isinstance(nd,(int,np.integer)): nd = self._node[nd]
+			if id(nd) in self._copied or id(nd) in new_nodes or self._node.get(nd.index) is not nd: continue
+			new_nodes[id(nd)] = nd._copy()
+		if not new_nodes: return
+		for new in new_nodes.values(): 
+			self._node[new.index] = new
+			self._copied.add(id(new))
+		self._nodelist[:] = [new_nodes.get(id(nd),nd) for nd in self._nodelist]
+		self._octree = None
+		if self._parent: self._parent._replace_nodes(new_nodes)
 	def _write_fehm(self,outfile):
 			
 		outfile.write('coor\n')
@@ -943,6 +1175,7 @@ class fgrid(object):				#Grid object.
 		# if parent but NO work dir - interpret string literally
 		# if parent and work dir but relative or absolute - interpret string relative to cwd
 		# if parent and work dir and grid name ONLY - grid goes in work dir
+		self._unshare()
 		
 		# PASS FULL PATH specification into fmake
 		temp_path = fpath()
@@ -1064,6 +1297,7 @@ class fgrid(object):				#Grid object.
 		:param volumefilename: Name of lagrit output file containing control volume information.
 		:type volumefilename: str
 		"""
+		self._unshare(deep=True)
 		infile = open(volumefilename,'r')
 		line = infile.readline() 
 		line = infile.readline().strip().split()
@@ -1082,12 +1316,15 @@ class fgrid(object):				#Grid object.
 			ndV = float(line[i+1])
 			self.node[ndI]._vol = ndV
 	def add_node(self,node=fnode()):		#Add a node object.
+		self._unshare()
 		self._nodelist.append(node)
 		self._node[node.index] = self._nodelist[-1]
 	def add_conn(self,conn=fconn()):		#Add a connection object.
+		self._unshare()
 		self._connlist.append(conn)
 		self._conn[(conn.nodes[0].index,conn.nodes[1].index)] = self.connlist[-1]
 	def add_elem(self,elem=felem()):		#Add an element object.
+		self._unshare()
 		self._elemlist.append(elem)
 		self._elem[elem.index] = self.elemlist[-1]
 	def node_nearest_point(self,pos = []):
@@ -1388,6 +1625,7 @@ class fgrid(object):				#Grid object.
 		:param centre: x and y coordinates of vertical axis about which to rotate. Alternatively, the centre of the computational domain can be specified by passing 'mid','middle','centre', or 'center'.
 		:type centre: [fl64,fl64], str
 		'''
+		self._unshare(deep=True)
 		if centre in ['middle','mid','centre','center']:
 			centre = [(self.xmin+self.xmax)/2.,(self.ymin+self.ymax)/2.]
 		for nd in self.nodelist:
@@ -266,17 +266,193 @@ if True: 					# output variable dictionaries defined in here, indented for code
 	'co2_sinkG',
 	'co2_inG',
 	'co2_outG']
+class _lazy_contour_data(object): 			# Contour data by time, read when accessed and least recently used discarded beyond memory budget.
+	def __init__(self,parent,memory=1000.):
+		from collections import OrderedDict
+		self._parent = parent
+		self._memory = memory 			# MB
+		self._files = {} 			# files and material file for each time
+		self._loaded = OrderedDict() 	# data for times in memory, least recently used first
+		self._user = {} 			# user variables for each time, see fcontour.new_variable()
+		self._reading = {} 			# data for times being read
+	def __getitem__(self,time):
+		if time in self._loaded:
+			self._loaded.move_to_end(time)
+			return self._loaded[time]
+		if time not in self._files: raise KeyError(time)
+		files,mat_file = self._files[time]
+		n = len(self._parent._times)
+		self._reading[time] = None
+		self._parent._read_group(files,mat_file) 		# stores data through __setitem__
+		del self._parent._times[n:] 					# time already indexed
+		data = self._reading.pop(time)
+		if time not in self._loaded: self._store(time,data) 		# discarded while reading another time
+		return data
+	def __setitem__(self,time,data):
+		data.update(self._user.get(time,{}))
+		if time in self._reading: self._reading[time] = data
+		self._store(time,data)
+	def _store(self,time,data):
+		self._loaded[time] = data
+		self._loaded.move_to_end(time)
+		if self._memory is None: return
+		size = sum([self._size(t) for t in self._loaded])
+		while size > self._memory*1.e6 and len(self._loaded) > 1:
+			t = next(iter(self._loaded))
+			size -= self._size(t)
+			self._loaded.pop(t)
+	def _size(self,time): return sum([v.nbytes for v in self._loaded[time].values() if isinstance(v,np.ndarray)])
+	def __contains__(self,time): return time in self._files or time in self._loaded
+	def __len__(self): return len(self.keys())
+	def __iter__(self): return iter(self.keys())
+	def keys(self): return list(set(self._files.keys())|set(self._loaded.keys()))
+	def values(self): return [self[time] for time in self.keys()]
+	def items(self): return [(time,self[time]) for time in self.keys()]
+	def get(self,time,default=None):
+		if time in self: return self[time]
+		return default
+class _dense_contour_data(object): 			# Contour data stored as one array per variable, a row for each time in increasing order, accessed by time as dictionaries of row views.
+	def __init__(self):
+		self._times = [] 			# time of each row
+		self._arrays = {} 			# array for each variable, rows beyond the number of times are spare capacity
+		self._static = {} 			# variables unchanged from the first time (e.g., coordinates), stored once
+		self._views = {} 			# dictionary of row views, and any other (e.g., user) variables, for each time
+		self._nodes = None
+		self._reserved = 0 			# number of times expected, for which rows are allocated up front
+	def __getitem__(self,time): return self._views[time]
+	def __setitem__(self,time,data):
+		from bisect import bisect_left
+		if self._nodes is None:
+			lens = [len(v) for v in data.values() if self._is_dense(v)]
+			if lens: self._nodes = lens[0]
+			for var in ['n','x','y','z','zone']:
+				if var in data and self._is_dense(data[var]): self._static[var] = data[var]
+		moved = False 		# rows of other times moved, their views need updating
+		if time in self._views: 
+			row = self._times.index(time)
+		else:
+			row = bisect_left(self._times,time)
+			moved = self._insert_row(row)
+			self._times.insert(row,time)
+			self._views[time] = {}
+		for var,value in data.items():
+			if var in self._static:
+				if value is self._static[var] or np.array_equal(value,self._static[var]): continue
+				self._make_dense(var,self._static.pop(var))
+				moved = True
+			if not self._is_dense(value): continue
+			if var not in self._arrays: 
+				self._make_dense(var,np.nan)
+				moved = True
+			self._arrays[var][row] = value
+		self._views[time].clear()
+		self._views[time].update([(var,value) for var,value in data.items() if var not in self._arrays and var not in self._static])
+		if moved: self._set_views()
+		else: self._set_views([time])
+	def _is_dense(self,value): return (isinstance(value,np.ndarray) and value.ndim == 1 and value.dtype.kind in 'biuf' and 
+		(self._nodes is None or len(value) == self._nodes))
+	def _capacity(self): 
+		if not self._arrays: return max(self._reserved,2*len(self._times),1)
+		return next(iter(self._arrays.values())).shape[0]
+	def _resize(self,capacity): 		# reallocate arrays with room for capacity times
+		n = len(self._times)
+		for var,array in self._arrays.items():
+			self._arrays[var] = np.full((capacity,self._nodes),np.nan,dtype=array.dtype)
+			self._arrays[var][:n] = array[:n]
+	def reserve(self,times): 		# allocate rows for the number of times about to be read
+		self._reserved = times
+		if self._arrays and self._capacity() < times: 
+			self._resize(times)
+			self._set_views()
+	def trim(self): 				# release rows not used by the times read
+		self._reserved = 0
+		if self._arrays and self._capacity() > len(self._times):
+			self._resize(len(self._times))
+			self._set_views()
+	def _insert_row(self,row): 			# make space for a new time at row, doubling capacity when full (e.g., follow mode)
+		n = len(self._times)
+		if not self._arrays: return False
+		moved = row < n
+		if n == self._capacity():
+			self._resize(max(2*n,self._reserved))
+			moved = True
+		for array in self._arrays.values(): array[row+1:n+1] = array[row:n]
+		return moved
+	def _make_dense(self,var,value): 		# array for a new variable, or variable previously unchanged between times
+		self._arrays[var] = np.full((self._capacity(),self._nodes),np.nan,dtype=np.result_type(np.asarray(value).dtype,float))
+		self._arrays[var][:len(self._times)] = value
+	def _set_views(self,times=None):
+		rows = enumerate(self._times) if times is None else [(self._times.index(time),time) for time in times]
+		for row,time in rows:
+			view = self._views[time]
+			for var,array in self._arrays.items(): view[var] = array[row]
+			view.update(self._static)
+	def array(self,var): 		# all times for one variable, without copying
+		n = len(self._times)
+		if var in self._static: return np.broadcast_to(self._static[var],(n,self._nodes))
+		return self._arrays[var][:n]
+	def __getstate__(self):
+		n = len(self._times)
+		views = dict([(time,dict([(var,value) for var,value in view.items() if var not in self._arrays and var not in self._static])) 
+			for time,view in self._views.items()])
+		return {'_times':self._times,'_arrays':dict([(var,array[:n].copy()) for var,array in self._arrays.items()]),
+			'_static':self._static,'_views':views,'_nodes':self._nodes}
+	def __setstate__(self,state):
+		self._reserved = 0
+		self.__dict__.update(state)
+		self._set_views()
+	def __contains__(self,time): return time in self._views
+	def __len__(self): return len(self._times)
+	def __iter__(self): return iter(self.keys())
+	def keys(self): return list(self._times)
+	def values(self): return [self[time] for time in self.keys()]
+	def items(self): return [(time,self[time]) for time in self.keys()]
+	def get(self,time,default=None):
+		if time in self: return self[time]
+		return default
+class _derived_data(object): 			# Contour data for one time, with derived variables calculated when first accessed and kept with the data.
+	def __init__(self,data,derived):
+		self._data = data
+		self._derived = derived
+	def __getitem__(self,var):
+		if var in self._derived and var not in self._data: self._data[var] = _evaluate_derived(self._derived[var],self)
+		return self._data[var]
+	def __setitem__(self,var,value): self._data[var] = value
+	def __contains__(self,var): return var in self._data or var in self._derived
+	def __len__(self): return len(self.keys())
+	def __iter__(self): return iter(self.keys())
+	def keys(self): return list(self._data.keys())+[var for var in self._derived if var not in self._data]
+	def values(self): return [self[var] for var in self.keys()]
+	def items(self): return [(var,self[var]) for var in self.keys()]
+	def get(self,var,default=None):
+		if var in self: return self[var]
+		return default
+class _derived_history(dict): 			# Derived history variable, time series for a node calculated when first accessed.
+	def __init__(self,parent,definition):
+		dict.__init__(self)
+		self._parent = parent
+		self._definition = definition
+	def __missing__(self,node):
+		if node not in self._parent._nodes and node not in self._parent._zones: raise KeyError(node)
+		self[node] = _evaluate_derived(self._definition,_history_node(self._parent,node))
+		return dict.__getitem__(self,node)
+class _history_node(object): 			# History data for one node, indexed by variable.
+	def __init__(self,parent,node):
+		self._parent = parent
+		self._node = node
+	def __getitem__(self,var): return self._parent._data[var][self._node]
+	def __contains__(self,var): return var in self._parent._data
 class fcontour(object): 					# Reading and plotting methods associated with contour output data.
 	'''Contour output information object.
 	
 	'''
-	def __init__(self,filename=None,latest=False,first=False,nearest=None):
+	def __init__(self,filename=None,latest=False,first=False,nearest=None,follow=False,lazy=False,memory=1000.,workers=None,cache=False):
 		if not isinstance(filename,list):
 			self._filename=os_path(filename)
 		self._silent = dflt.silent
 		self._times=[]   
 		self._format = ''
-		self._data={}
+		self._data=_dense_contour_data()
 		self._material = {}
 		self._material_properties = []
 		self._row=None
@@ -300,15 +476,47 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 		self._nearest = nearest
 		if isinstance(self._nearest,(float,int)): self._nearest = [self._nearest]
 		self._nkeys=1
-		if filename is not None: self.read(filename,self._latest,self._first,self._nearest)
+		self._follow = follow 			# follow mode: times are added as they are written, so their number is unknown
+		self._ingested = set() 		# follow mode: files already read
+		self._pending = {} 			# follow mode: size of files in incomplete time groups
+		self._subscribers = []
+		self._interpolators = {} 		# interpolation matrices for slices and profiles, by points and method
+		self._derived = {} 			# definitions of derived variables
+		if lazy: self._data = _lazy_contour_data(self,memory)
+		if filename is not None: 
+			if follow: self.update()
+			else: self.read(filename,self._latest,self._first,self._nearest,workers=workers,cache=cache)
 	def __getitem__(self,key):
-		if key in self.times:
-			return self._data[key]
-		elif np.min(abs(self.times-key)/self.times)<.01:
-			ind = np.argmin(abs(self.times-key))
-			return self._data[self.times[ind]]
-		else: return None
-	def read(self,filename,latest=False,first=False,nearest=[]): 						# read contents of file
+		weights = _time_weights(self,key,'nearest',.01)
+		if weights is None: return None
+		data = self._data[self._times[weights[0][0]]]
+		if self._derived: return _derived_data(data,self._derived)
+		return data
+	def lookup(self,time,method='nearest',tolerance=None):
+		'''Returns output data for a time, found by binary search of the output times. fcontour[time] is equivalent to the 'nearest' method, with a tolerance of 0.01.
+		
+		:param time: Time for which output data are required.
+		:type time: fl64
+		:param method: 'nearest' output time, 'exact' output time, or 'linear' interpolation between the output times either side of time.
+		:type method: str
+		:param tolerance: Largest difference between time and the output time returned, as a fraction of the output time, for 'nearest' and 'exact' methods (zero for 'exact' by default).
+		:type tolerance: fl64
+		:returns: Dictionary of data, indexed by variable, or None if no output time found.
+		'''
+		weights = _time_weights(self,time,method,tolerance)
+		if weights is None: return None
+		datas = [self._data[self._times[i]] for i,weight in weights]
+		if len(datas) == 1: data = datas[0]
+		else:
+			(i0,w0),(i1,w1) = weights
+			data = {}
+			for var in datas[0]:
+				if var not in datas[1] or var in self._derived: continue
+				if datas[0][var] is datas[1][var]: data[var] = datas[0][var] 		# e.g., coordinates
+				else: data[var] = w0*np.asarray(datas[0][var])+w1*np.asarray(datas[1][var])
+		if self._derived: return _derived_data(data,self._derived)
+		return data
+	def read(self,filename,latest=False,first=False,nearest=[],lazy=False,workers=None,cache=False): 						# read contents of file
 		'''Read in FEHM contour output information.
 		
 		:param filename: File name for output data, can include wildcards to define multiple output files.
@@ -319,8 +527,16 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 		:type first: bool
 		:param nearest: Read in the file with date closest to the day supplied. List input will parse multiple output files.
 		:type nearest: fl64,list
+		:param lazy: Record the output time of each file without reading data. Data for a time are read when first accessed, and the most recently used kept in memory (see fcontour memory argument).
+		:type lazy: bool
+		:param workers: Number of processes reading output times in parallel. Times are ordered as for a serial read. Ignored for lazy reading.
+		:type workers: int
+		:param cache: Save the data read in binary (.npy) files, in a 'pyfehm_contour_cache' folder next to the output files. If the output files are unchanged, later reads load the binary files instead, memory-mapped so that data are read from disk only when used. Ignored for lazy reading.
+		:type cache: bool
 		'''
 		from glob import glob
+		if lazy and not isinstance(self._data,_lazy_contour_data): self._data = _lazy_contour_data(self)
+		lazy = isinstance(self._data,_lazy_contour_data)
 		if isinstance(filename,list):
 			files = filename
 		else:
@@ -408,6 +624,15 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			FILES.append(sort_tec_files([file for file in files if tag in file]))
 		FILES = np.array(FILES)
 		
+		# binary cache of previously read output
+		cache = cache and not lazy and not self._times
+		if cache:
+			cache_files = sorted(set([str(file) for file in FILES.flatten()]+([mat_file] if mat_file else [])))
+			cache_dir = _contour_cache_directory(cache_files)
+			if self._read_cache(cache_dir,cache_files): 
+				cache = False
+				FILES = FILES[:,:0] 		# nothing left to read
+		
 		# determine headers for 'tec' output
 		for i in range(FILES.shape[1]):
 			if not self._variables:
@@ -428,6 +653,9 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 					self._setup_headers_tec(headers)		
 		
 		# read in output data
+		reserve = isinstance(self._data,_dense_contour_data) and not self._follow
+		if reserve: self._data.reserve(len(self._data)+FILES.shape[1]) 		# number of times known, allocate once
+		groups = [] 		# groups of files read in parallel, after the first
 		for i in range(FILES.shape[1]):
 			files = FILES[:,i]
 			# Skip -1 file if present
@@ -446,10 +674,12 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 				elif self._format=='surf': self._setup_headers_surf(headers)
 				else: pyfehm_print('ERROR: Unrecognised format',self._silent);return
 				self.num_columns = len(self.variables)+1
-			if self.format == 'tec': self._read_data_tec(files,mat_file)
-			elif self.format == 'surf': self._read_data_surf(files,mat_file)
-			elif self.format == 'avs': self._read_data_avs(files,mat_file)
-			elif self.format == 'avsx': self._read_data_avsx(files,mat_file)
+			if lazy: self._index_group(files,mat_file)
+			elif workers and workers>1 and self._times: groups.append(files)
+			else: self._read_group(files,mat_file)
+		if groups: self._read_groups_parallel(groups,workers)
+		if reserve: self._data.trim()
+		if cache and self._times: self._write_cache(cache_dir,cache_files)
 		
 		# assemble grid information
 		if 'x' in self.variables:
@@ -461,7 +691,7 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 		if 'z' in self.variables:
 			self._z = np.unique(self[self.times[0]]['z'])
 			self._zmin,self._zmax = np.min(self.z), np.max(self.z)
-		if dflt.parental_cont:
+		if dflt.parental_cont and not self._silent:
 			print('')
 			print('!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!')
 			print('WARNING:')
@@ -482,6 +712,163 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			print('To turn off this message, open the environment file \'fdflt.py\' and set self.parental_cont = False')
 			print('!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!')
 			print('')
+	def update(self):
+		'''Read contour output for times written since the last update, e.g., while a simulation is running. Files are read once all 
+		parts of a time (e.g., '_sca_', '_vec_' and '_con_' files) are present and completely written, i.e., a later time has been started 
+		or the file sizes have not changed since the previous update. Use with fcontour(filename, follow=True). 
+		
+		:returns: List of new times. Subscribers are called with each new time and its data.
+		'''
+		from glob import glob
+		self._follow = True
+		files = [file for file in glob(self._filename) if file not in self._ingested]
+		mat_files = [file for file in files if 'mat_node' in file]
+		# group files by output time
+		groups = {}
+		for file in files:
+			for file_type in ['sca','vec','con','hf']:
+				tag = '_'+file_type+'_node'
+				if tag in file: groups.setdefault(file.split(tag)[0],{})[file_type] = file
+		file_types = set(self._file_types())
+		for group in groups.values(): file_types.update(group.keys())
+		prefixes = sorted(groups.keys(),key=lambda prefix: max([os.path.getmtime(file) for file in groups[prefix].values()]))
+		ready = []
+		for i,prefix in enumerate(prefixes):
+			group = groups[prefix]
+			if set(group.keys()) != file_types: continue
+			sizes = dict([(file,os.path.getsize(file)) for file in group.values()])
+			if i == len(prefixes)-1 and any([self._pending.get(file) != sizes[file] for file in group.values()]):
+				self._pending.update(sizes) 		# latest time may still be being written
+				continue
+			ready.extend(list(group.values()))
+		if not ready: return []
+		times0 = list(self._times)
+		if not self._material_properties: ready.extend(mat_files)
+		silent = self._silent
+		self._silent = silent or bool(self._ingested) 		# file names and warning printed for the first files read only, not on each poll
+		try: self.read(ready)
+		finally: self._silent = silent
+		for file in ready: 
+			self._ingested.add(file)
+			if file in self._pending: self._pending.pop(file)
+		new = [time for time in self._times if time not in times0]
+		for time in new:
+			for subscriber in self._subscribers: subscriber(time,self._data[time])
+		return new
+	def _file_types(self): 				# contour file types read so far
+		file_types = []
+		for file in self._ingested:
+			for file_type in ['sca','vec','con','hf']:
+				if '_'+file_type+'_node' in file and file_type not in file_types: file_types.append(file_type)
+		return file_types
+	def subscribe(self,callback):
+		'''Register a function to be called with each new time, and its data, read by update() or follow().
+		
+		:param callback: Function taking time and data dictionary, i.e., callback(time, fcontour[time]).
+		:type callback: func
+		'''
+		if callback not in self._subscribers: self._subscribers.append(callback)
+	def follow(self,interval=dflt.sleep_time,timeout=None):
+		'''Generator yielding new contour output times as they are written, e.g., while a simulation is running. The output files are checked
+		with increasing wait times, from dflt.sleep_time_min up to interval, while no new output is found.
+		
+		:param interval: Longest wait (s) between checks for new output.
+		:type interval: fl64
+		:param timeout: Stop after this time (s) without new output. By default, continues until the generator is closed.
+		:type timeout: fl64
+		:returns: Each new time, as it is read.
+		'''
+		from time import sleep,time
+		wait = dflt.sleep_time_min
+		last = time()
+		while True:
+			new = self.update()
+			if new:
+				wait = dflt.sleep_time_min
+				last = time()
+				for t in new: yield t
+			elif timeout is not None and time()-last > timeout: return
+			else: 
+				sleep(wait)
+				wait = min(2*wait,interval)
+	def _read_group(self,files,mat_file): 		# read files for one output time
+		if self.format == 'tec': self._read_data_tec(files,mat_file)
+		elif self.format == 'surf': self._read_data_surf(files,mat_file)
+		elif self.format == 'avs': self._read_data_avs(files,mat_file)
+		elif self.format == 'avsx': self._read_data_avsx(files,mat_file)
+	def _read_groups_parallel(self,groups,workers): 		# read files for several output times in a process pool
+		from concurrent.futures import ProcessPoolExecutor
+		time0 = self._times[0]
+		state = {'_format':self._format,'_variables':self._variables,'_silent':self._silent,'_times':[time0],
+			'_data':{time0:dict([(var,self._data[time0][var]) for var in ['n','x','y','z','zone'] if var in self._data[time0]])}}
+		pool = ProcessPoolExecutor(max_workers=workers,initializer=_contour_worker_init,initargs=(state,))
+		try:
+			for time,data,shared in pool.map(_contour_worker_read,groups):
+				if time is None: continue
+				for var in shared: data[var] = self._data[time0][var]
+				self._times.append(time)
+				self._data[time] = data
+		finally: pool.shutdown()
+	def _read_cache(self,cache_dir,cache_files): 		# load memory-mapped binary data if output files unchanged, returns False otherwise
+		import json
+		try:
+			fp = open(cache_dir+os.sep+'manifest.json','r')
+			manifest = json.load(fp)
+			fp.close()
+		except (IOError,ValueError): return False
+		if manifest['files'] != _contour_file_signatures(cache_files): return False
+		data = _dense_contour_data()
+		data._times = manifest['times']
+		data._nodes = manifest['nodes']
+		data._arrays = dict([(var,np.load(cache_dir+os.sep+'dense_%i.npy'%i,mmap_mode='c')) for i,var in enumerate(manifest['dense'])])
+		data._static = dict([(var,np.load(cache_dir+os.sep+'static_%i.npy'%i,mmap_mode='c')) for i,var in enumerate(manifest['static'])])
+		data._views = dict([(time,{}) for time in data._times])
+		data._set_views()
+		self._data = data
+		self._times = manifest['read_times']
+		self._format = manifest['format']
+		self._variables = manifest['variables']
+		self.num_columns = len(self._variables)+1
+		self._material_properties = manifest['material_properties']
+		self._material = dict([(var,np.load(cache_dir+os.sep+'material_%i.npy'%i,mmap_mode='c')) for i,var in enumerate(self._material_properties)])
+		pyfehm_print('Reading cached data in '+cache_dir,self._silent)
+		return True
+	def _write_cache(self,cache_dir,cache_files): 		# save data read as binary files, manifest written last
+		import json
+		if not isinstance(self._data,_dense_contour_data): return
+		try:
+			if not os.path.isdir(cache_dir): os.makedirs(cache_dir)
+			for name in os.listdir(cache_dir): os.remove(cache_dir+os.sep+name) 	# out of date, files may be mapped elsewhere so not overwritten
+			self._write_cache_files(cache_dir,cache_files)
+		except (IOError,OSError): pyfehm_print('WARNING: could not write cached data in '+cache_dir,self._silent)
+	def _write_cache_files(self,cache_dir,cache_files):
+		import json
+		manifest = {'files':_contour_file_signatures(cache_files),'format':self._format,'variables':self._variables,
+			'read_times':self._times,'times':self._data._times,'nodes':self._data._nodes,
+			'dense':list(self._data._arrays.keys()),'static':list(self._data._static.keys()),'material_properties':self._material_properties}
+		for i,var in enumerate(manifest['dense']): np.save(cache_dir+os.sep+'dense_%i.npy'%i,self._data.array(var))
+		for i,var in enumerate(manifest['static']): np.save(cache_dir+os.sep+'static_%i.npy'%i,self._data._static[var])
+		for i,var in enumerate(self._material_properties): np.save(cache_dir+os.sep+'material_%i.npy'%i,self._material[var])
+		fp = open(cache_dir+os.sep+'manifest.json','w')
+		json.dump(manifest,fp,default=float)
+		fp.close()
+	def _index_group(self,files,mat_file): 		# record output time of files for lazy reading, without reading data
+		file = sorted(files)[0]
+		if self.format == 'tec':
+			fp = open(file,'r')
+			ln = fp.readline()
+			while not ln.startswith('ZONE'): ln = fp.readline()
+			fp.close()
+			time = float(ln.split('"')[1].split('days')[0].strip().split()[-1].strip())
+			if self._times and time<self._times[0]: return
+		elif self.format == 'avsx':
+			fp = open(file,'r')
+			header = fp.readline()
+			fp.close()
+			time = float(header.split('nodes at ')[1].split('days')[0])*24*2600
+		else: time = _file_time(file)
+		self._times.append(time)
+		self._data._files[time] = (files,mat_file)
 	def _detect_format(self,headers):
 		if headers[0].startswith('TITLE ='):		# check for TEC output
 			self._format = 'tec'
@@ -516,9 +903,10 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 				self._times.append(time)		
 			lns = fp.readlines()
 			fp.close()
-			datas.append(np.array([[float(d) for d in ln.strip().split(':')] for ln in lns]))
+			datas.append(_parse_block(lns,':'))
 		data = np.concatenate(datas,1)
 		self._data[time] = dict([(var,data[:,icol]) for icol,var in enumerate(self.variables)])
+		self._share_coordinates(time)
 		
 		if mat_file and not self._material_properties:
 			fp = open(mat_file,'r')
@@ -526,7 +914,7 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			self._material_properties = header.split(':')[1:]
 			lns = fp.readlines()
 			fp.close()
-			data = np.array([[float(d) for d in ln.strip().split(':')[1:]] for ln in lns])
+			data = _parse_block(lns,':',skip=1)
 			self._material= dict([(var,data[:,icol]) for icol,var in enumerate(self._material_properties)])
 	def _setup_headers_avs(self,headers,files): 		# headers for the AVS output format
 		for header,file in zip(headers,files):
@@ -550,24 +938,17 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			lns = lns[int(float(lns[0].split()[0]))+1:]
 			
 			if first: 
-				file = file.split('_node')[0]
-				file = file.split('_sca')[0]
-				file = file.split('_con')[0]
-				file = file.split('_vec')[0]
-				file = file.split('_hf')[0]
-				file = file.split('_days')[0]						
-				file = file.split('.')
-				file = [fl for fl in file if fl.isdigit() or 'E-' in fl]
-				time = float('.'.join(file))
+				time = _file_time(file)
 				self._times.append(time)
 			
 			if first: 
-				datas.append(np.array([[float0(d) for d in ln.strip().split()] for ln in lns]))
+				datas.append(_parse_block(lns))
 			else:
-				datas.append(np.array([[float0(d) for d in ln.strip().split()[4:]] for ln in lns]))
+				datas.append(_parse_block(lns,skip=4))
 			
 		data = np.concatenate(datas,1)
 		self._data[time] = dict([(var,data[:,icol]) for icol,var in enumerate(self.variables)])
+		self._share_coordinates(time)
 	def _setup_headers_surf(self,headers): 		# headers for the SURF output format
 		for header in headers:
 			header = header.strip().split(', ')
@@ -586,15 +967,7 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			lni = file.split('.',1)[1]
 			
 			if first: 
-				file = file.split('_node')[0]
-				file = file.split('_sca')[0]
-				file = file.split('_con')[0]
-				file = file.split('_vec')[0]
-				file = file.split('_hf')[0]
-				file = file.split('_days')[0]						
-				file = file.split('.')
-				file = [fl for fl in file if fl.isdigit() or 'E-' in fl]
-				time = float('.'.join(file))
+				time = _file_time(file)
 				self._times.append(time)
 			
 			lni=fp.readline()			
@@ -602,12 +975,13 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			fp.close()
 			
 			if first: 
-				datas.append(np.array([[float0(d) for d in ln.strip().split(',')] for ln in lns]))
+				datas.append(_parse_block(lns,','))
 			else:
-				datas.append(np.array([[float0(d) for d in ln.strip().split(',')[4:]] for ln in lns]))
+				datas.append(_parse_block(lns,',',skip=4))
 			
 		data = np.concatenate(datas,1)
 		self._data[time] = dict([(var,data[:,icol]) for icol,var in enumerate(self.variables)])
+		self._share_coordinates(time)
 		
 		if mat_file and not self._material_properties:
 			fp = open(mat_file,'r')
@@ -617,7 +991,7 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 					self._material_properties.append(mat_prop.strip())
 			lns = fp.readlines()
 			fp.close()
-			data = np.array([[float(d) for d in ln.strip().split(',')[1:]] for ln in lns])
+			data = _parse_block(lns,',',skip=1)
 			self._material= dict([(var,data[:,icol]) for icol,var in enumerate(self._material_properties)])
 	def _setup_headers_tec(self,headers): 		# headers for the TEC output format
 		for header in headers:
@@ -658,14 +1032,14 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			
 			if has_xyz:
 				if first: 
-					datas.append(np.array([[float0(d) for d in ln.strip().split()] for ln in lns]))
+					datas.append(_parse_block(lns))
 				else:
-					datas.append(np.array([[float0(d) for d in ln.strip().split()[4:]] for ln in lns]))
+					datas.append(_parse_block(lns,skip=4))
 			else:
 				if first: 
-					datas.append(np.array([[float0(d) for d in ln.strip().split()] for ln in lns]))
+					datas.append(_parse_block(lns))
 				else:
-					datas.append(np.array([[float0(d) for d in ln.strip().split()[1:]] for ln in lns]))
+					datas.append(_parse_block(lns,skip=1))
 						
 		data = np.concatenate(datas,1)
 		if data.shape[1]< len(self.variables): 		# insert xyz data from previous read
@@ -684,6 +1058,7 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 					data2.append(data[:,j]); j +=1
 			data = np.transpose(np.array(data2))
 		self._data[time] = dict([(var,data[:,icol]) for icol,var in enumerate(self.variables)])
+		self._share_coordinates(time)
 		if mat_file and not self._material_properties:
 			fp = open(mat_file,'r')
 			fp.readline()
@@ -694,8 +1069,23 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			if lns[0].startswith('ZONE'): lns = lns[1:]
 			fp.close()
 			if nds: lns = lns[:nds] 		# truncate to remove connectivity information
-			data = np.array([[float(d) for d in ln.strip().split()[4:]] for ln in lns[:-1]])
+			data = _parse_block(lns[:-1],skip=4)
 			self._material= dict([(var,data[:,icol]) for icol,var in enumerate(self._material_properties)])
+	def _share_coordinates(self,time):		# coordinates repeated at later times refer to arrays of first time, stored once
+		if time == self._times[0]: return
+		data = self._data[time]
+		first = self._data[self._times[0]]
+		for var in ['n','x','y','z']:
+			if var in first and var in data and np.array_equal(first[var],data[var]): data[var] = first[var]
+	def _interpolate(self,points,vals,pointsI,method): 		# interpolate values at points onto pointsI, as griddata, reusing matrix for same points
+		if method not in ['nearest','linear']: 
+			from scipy.interpolate import griddata
+			return griddata(points,vals,pointsI,method=method)
+		key = (method,content_hash(points,pointsI))
+		if key not in self._interpolators:
+			if len(self._interpolators) >= 20: self._interpolators.pop(next(iter(self._interpolators)))
+			self._interpolators[key] = _interpolation_matrix(points,pointsI,method)
+		return self._interpolators[key].dot(vals)
 	def _check_inputs(self,variable, time, slice):	# assesses whether sufficient input information for slice plot
 		if not variable: 
 			s = ['ERROR: no plot variable specified.']
@@ -739,8 +1129,35 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 			pyfehm_print('ERROR: there is already a variable called \''+name+'\', please choose a different name',self._silent)
 			return
 		self._data[time][name] = data
+		if isinstance(self._data,_lazy_contour_data): self._data._user.setdefault(time,{})[name] = data 		# kept when data unloaded
 		if name not in self._user_variables:
 			self._user_variables.append(name)
+	def derived_variable(self,name,definition):
+		'''Defines a variable calculated from other variables when it is first accessed for a time, e.g., by fcontour[time][name], slice(), 
+		profile(), node() or paraview(). Values are kept with the data for that time, and calculated again if the data are read again or 
+		the variable is redefined.
+		
+		:param name: Name for the variable.
+		:type name: str
+		:param definition: Function taking the data for one time, indexed by variable name, and returning the variable, e.g., lambda d: d['strs_zz']-d['P']. Alternatively, an expression in terms of variable names, e.g., 'strs_zz-P', in which NumPy is available as np. None removes the variable.
+		:type definition: func, str
+		'''
+		if name in self.variables or (name in self.user_variables and name not in self._derived):
+			pyfehm_print('ERROR: there is already a variable called \''+name+'\', please choose a different name',self._silent)
+			return
+		for data in self._loaded_data(): 		# values of derived variables may depend on this definition
+			for var in self._derived: 
+				if var in data: data.pop(var)
+		if definition is None:
+			if name in self._derived: self._derived.pop(name)
+			if name in self._user_variables: self._user_variables.remove(name)
+			return
+		self._derived[name] = definition
+		if name not in self._user_variables: self._user_variables.append(name)
+	def _loaded_data(self): 		# data dictionaries for times currently in memory
+		if isinstance(self._data,_lazy_contour_data): return list(self._data._loaded.values())
+		if isinstance(self._data,_dense_contour_data): return list(self._data._views.values())
+		return list(self._data.values())
 	def slice(self, variable, slice, divisions, time=None, method='nearest'):
 		'''Returns mesh data for a specified slice orientation from 3-D contour output data.
 		
@@ -760,7 +1177,6 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 		if time==None: 
 			if np.min(self.times)<0: time = self.times[0]
 			else: time = self.times[-1]
-		from scipy.interpolate import griddata		
 		delta = False
 		if isinstance(time,list) or isinstance(time,np.ndarray):
 			if len(time)>1: 
@@ -810,11 +1226,11 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 				Z = (X+np.sqrt(1.757))/(X+np.sqrt(1.757))*slice[1]
 				pointsI = np.transpose(np.reshape((X,Y,Z),(3,X.size)))
 				vals = np.transpose(np.array(dat[variable]))
-				valsI = griddata(points,vals,pointsI,method=method)
+				valsI = self._interpolate(points,vals,pointsI,method)
 				valsI =  np.reshape(valsI,(X.shape[0],X.shape[1]))
 				if delta:
 					vals = np.transpose(np.array(dat0[variable]))
-					valsI0 = griddata(points,vals,pointsI,method=method)
+					valsI0 = self._interpolate(points,vals,pointsI,method)
 					valsI0 =  np.reshape(valsI0,(X.shape[0],X.shape[1]))
 					valsI = valsI - valsI0
 			elif isinstance(slice[0],list):
@@ -838,11 +1254,11 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 				points = np.transpose(np.array([dat['x'],dat['y'],dat['z']]))
 				pointsI = np.transpose(np.reshape((X,Y,Z),(3,X.size)))
 				vals = np.transpose(np.array(dat[variable]))
-				valsI = griddata(points,vals,pointsI,method=method)
+				valsI = self._interpolate(points,vals,pointsI,method)
 				valsI =  np.reshape(valsI,(X.shape[0],X.shape[1]))
 				if delta:
 					vals = np.transpose(np.array(dat0[variable]))
-					valsI0 = griddata(points,vals,pointsI,method=method)
+					valsI0 = self._interpolate(points,vals,pointsI,method)
 					valsI0 =  np.reshape(valsI0,(X.shape[0],X.shape[1]))
 					valsI = valsI - valsI0
 			
@@ -1133,7 +1549,6 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 		if isinstance(profile,list): profile = np.array(profile)
 		if divisions: divisions = int(divisions)
 		if time==None: time = self.times[-1]		
-		from scipy.interpolate import griddata
 		if not isinstance(variable,list): variable = [variable,]
 		
 		dat = self[time]
@@ -1149,7 +1564,7 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 		outpoints = [list(profile[:,0]),list(profile[:,1]),list(profile[:,2])]
 		for var in variable:
 			vals = np.transpose(np.array(dat[var]))
-			valsI = griddata(points,vals,profile,method=method)
+			valsI = self._interpolate(points,vals,profile,method)
 			outpoints.append(list(valsI))
 		
 		return np.array(outpoints).transpose()
@@ -1398,6 +1813,97 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 		extension, save_fname, pdf = save_name(save=save,variable=variable,time=time)
 		plt.savefig(save_fname, dpi=100, facecolor='w', edgecolor='w',orientation='portrait', 
 		format=extension,transparent=True, bbox_inches=None, pad_inches=0.1)
+	def array(self,variable):
+		'''Returns output data for one variable at all times, as an array with a row for each output time (in increasing order) and 
+		a column for each node. For output read into memory, this is a view of the stored data, not a copy, e.g., 
+		fcontour.array('T')[:,9] is the temperature history of the tenth node, and np.diff(fcontour.array('T'),axis=0) the changes between output times.
+		
+		:param variable: Output data variable, for example 'P' = pressure.
+		:type variable: str
+		:returns: ndarray of shape (number of times, number of nodes).
+		'''
+		if variable not in self.variables+self.user_variables:
+			pyfehm_print('ERROR: no variable by that name',self._silent)
+			return
+		if isinstance(self._data,_dense_contour_data) and (variable in self._data._arrays or variable in self._data._static):
+			return self._data.array(variable)
+		return np.array([self[time][variable] for time in sorted(self._data.keys())])
+	def _stress_arrays(self,times=None): 		# stress components and pressure, arrays of shape (times, nodes)
+		variables = ['strs_xx','strs_yy','strs_zz','strs_xy','strs_xz','strs_yz','P']
+		for var in variables:
+			if var not in self.variables:
+				pyfehm_print('ERROR: stress and pressure output required, \''+var+'\' not available',self._silent)
+				return None
+		if times is None: return [self.array(var) for var in variables]
+		if np.ndim(times) == 0: times = [times]
+		return [np.array([self[time][var] for time in times]) for var in variables]
+	def traction(self,azimuth,dip,times=None):
+		'''Returns normal and shear stress at every node and output time, on planes of the given orientation. Several orientations can be 
+		supplied at once as lists of azimuth and dip.
+		
+		:param azimuth: Fault azimuth (degrees, relative to x), as for slice() with a 'cfs' variable.
+		:type azimuth: fl64, lst[fl64]
+		:param dip: Fault dip (degrees).
+		:type dip: fl64, lst[fl64]
+		:param times: Output times for which stresses are calculated. Default is all times.
+		:type times: lst[fl64]
+		:returns: Normal stress and shear stress, arrays of shape (times, nodes), or (orientations, times, nodes) for lists of azimuth and dip.
+		'''
+		stresses = self._stress_arrays(times)
+		if stresses is None: return
+		sxx,syy,szz,sxy,sxz,syz,p = stresses
+		sig = []; tau = []
+		for nx,ny,nz in _plane_normals(azimuth,dip):
+			px = sxx*nx+sxy*ny+sxz*nz
+			py = sxy*nx+syy*ny+syz*nz
+			pz = sxz*nx+syz*ny+szz*nz
+			sigi = px*nx+py*ny+pz*nz
+			sig.append(sigi)
+			tau.append(np.sqrt(np.maximum(px**2+py**2+pz**2-sigi**2,0.)))
+		if np.ndim(azimuth) == 0 and np.ndim(dip) == 0: return sig[0],tau[0]
+		return np.array(sig),np.array(tau)
+	def principal_stresses(self,times=None,vectors=False):
+		'''Returns principal stresses at every node and output time.
+		
+		:param times: Output times for which stresses are calculated. Default is all times.
+		:type times: lst[fl64]
+		:param vectors: Also return principal directions. These require a 3x3 array for every node and time.
+		:type vectors: bool
+		:returns: Principal stresses, largest first, as an array of shape (3, times, nodes). If vectors is True, also an array of shape (times, nodes, 3, 3) whose columns are the corresponding directions.
+		'''
+		stresses = self._stress_arrays(times)
+		if stresses is None: return
+		sxx,syy,szz,sxy,sxz,syz,p = stresses
+		if vectors:
+			S = np.array([[sxx,sxy,sxz],[sxy,syy,syz],[sxz,syz,szz]]).transpose((2,3,0,1))
+			values,vecs = np.linalg.eigh(S)
+			return np.moveaxis(values[...,::-1],-1,0),vecs[...,::-1]
+		return _principal_values(sxx,syy,szz,sxy,sxz,syz)
+	def cfs(self,azimuth=None,dip=None,friction=0.6,cohesion=0.,times=None):
+		'''Returns Coulomb failure stress at every node and output time, from nodal stress and pressure without interpolation. For given 
+		fault orientations, CFS = shear stress - friction*(normal stress - pressure) - cohesion, as for slice() with a 'cfs' variable. If orientation is 
+		not given, CFS is calculated on optimally oriented planes, from the largest and smallest principal stresses.
+		
+		:param azimuth: Fault azimuth (degrees, relative to x). Can be a list, with dip, for several orientations. 
+		:type azimuth: fl64, lst[fl64]
+		:param dip: Fault dip (degrees).
+		:type dip: fl64, lst[fl64]
+		:param friction: Friction coefficient.
+		:type friction: fl64
+		:param cohesion: Cohesion.
+		:type cohesion: fl64
+		:param times: Output times for which CFS is calculated. Default is all times.
+		:type times: lst[fl64]
+		:returns: Array of shape (times, nodes), or (orientations, times, nodes) for lists of azimuth and dip.
+		'''
+		stresses = self._stress_arrays(times)
+		if stresses is None: return
+		p = stresses[-1]
+		if azimuth is None or dip is None:
+			s1,s2,s3 = _principal_values(*stresses[:-1])
+			return 0.5*(s1-s3)*np.sqrt(1.+friction**2) - friction*(0.5*(s1+s3)-p) - cohesion
+		sig,tau = self.traction(azimuth,dip,times)
+		return tau - friction*(sig-p) - cohesion
 	def node(self,node,time=None,variable=None):
 		'''Returns all information for a specific node.
 		
@@ -1423,20 +1929,12 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 		nd = np.where(self[self.times[0]]['n']==node)[0][0]
 		if time is None and variable is None:
 			ks = copy(self.variables); ks.remove('n')
-			outdat = dict([(k,[]) for k in ks])
-			for t in self.times:
-				dat = self[t]
-				for k in list(outdat.keys()):
-					outdat[k].append(dat[k][nd])
+			outdat = dict([(k,self.array(k)[:,nd]) for k in ks])
 		elif time is None:
-			if variable not in self.variables: 
+			if variable not in self.variables+self.user_variables: 
 				pyfehm_print('ERROR: no variable by that name',self._silent)
 				return
-			outdat = []
-			for t in self.times:
-				dat = self[t]
-				outdat.append(dat[variable][nd])
-			outdat = np.array(outdat)
+			outdat = self.array(variable)[:,nd]
 		elif variable is None:
 			ks = copy(self.variables); ks.remove('n')
 			outdat = dict([(k,self[time][k][nd]) for k in ks])			
@@ -1479,7 +1977,7 @@ class fcontour(object): 					# Reading and plotting methods associated with cont
 	format = property(_get_format) #: (*str*) Format of output file, options are 'tec', 'surf', 'avs' and 'avsx'.
 	def _get_filename(self): return self._filename
 	filename = property(_get_filename)  #: (*str*) Name of FEHM contour output file. Wildcards can be used to define multiple input files.
-	def _get_times(self): return np.sort(self._times)
+	def _get_times(self): return _sorted_times(self)[0]
 	times = property(_get_times)	#: (*lst[fl64]*) List of times (in seconds) for which output data are available.
 	def _get_material_properties(self): return self._material_properties
 	def _set_material_properties(self,value): self._material_properties = value
@@ -1529,7 +2027,7 @@ class fhistory(object):						# Reading and plotting methods associated with hist
 	'''History output information object.
 	
 	'''
-	def __init__(self,filename=None,verbose=True):
+	def __init__(self,filename=None,verbose=True,follow=False):
 		self._filename=None	
 		self._silent = dflt.silent
 		self._format = ''
@@ -1545,12 +2043,33 @@ class fhistory(object):						# Reading and plotting methods associated with hist
 		self.column_name=[]
 		self.num_columns=0
 		self._nkeys=1
+		self._tail={} 			# follow mode: byte offset, variable and row buffer for each file
 		filename = os_path(filename)
-		if filename: self._filename=filename; self.read(filename)
+		if filename: 
+			self._filename=filename
+			if follow: self.update()
+			else: self.read(filename)
 	def __getitem__(self,key):
 		if key in self.variables or key in self.user_variables:
 			return self._data[key]
 		else: return None
+	def lookup(self,time,method='nearest',tolerance=None):
+		'''Returns output data for a time, found by binary search of the output times.
+		
+		:param time: Time for which output data are required.
+		:type time: fl64
+		:param method: 'nearest' output time, 'exact' output time, or 'linear' interpolation between the output times either side of time.
+		:type method: str
+		:param tolerance: Largest difference between time and the output time returned, as a fraction of the output time, for 'nearest' and 'exact' methods (zero for 'exact' by default).
+		:type tolerance: fl64
+		:returns: Data indexed as the fhistory object, i.e., data[variable][node], or None if no output time found.
+		'''
+		weights = _time_weights(self,time,method,tolerance)
+		if weights is None: return None
+		for var in self._user_variables: 		# derived variables at all nodes
+			if isinstance(self._data.get(var),_derived_history): 
+				for node in self._data[self._variables[0]]: self._data[var][node]
+		return _weighted_data(self._data,weights)
 	def __repr__(self): 
 		retStr =  'History output for variables '
 		for var in self.variables:
@@ -1669,6 +2188,104 @@ class fhistory(object):						# Reading and plotting methods associated with hist
 		if data[-1,0]<data[-2,0]: data = data[:-1,:]
 		self._times = np.array(data[:,0])
 		self._data[hist_var_names[var_key]] = dict([(node,data[:,icol+1]) for icol,node in enumerate(self.nodes)])
+	def update(self):
+		'''Read rows appended to history files since the last update, e.g., while a simulation is running. Only new data are parsed, 
+		starting from where the previous update finished, and files that have appeared since are included. Use with fhistory(filename, follow=True). 
+		
+		:returns: Tuple of new times and new data, indexed as the fhistory object, i.e., data[variable][node][time_index]. Times are only 
+		returned when data are available for all variables.
+		'''
+		from glob import glob
+		import re
+		glob_pattern = re.sub(r'\[','[[]',self._filename)
+		glob_pattern = re.sub(r'(?<!\[)\]','[]]', glob_pattern)
+		n0 = len(self._times)
+		for fname in sorted(glob(glob_pattern)):
+			if fname not in self._tail: 
+				if not self._tail_header(fname): continue 			# header not yet (completely) written
+			self._tail_rows(fname)
+		if not self._tail: return np.array([]),{}
+		# expose rows available for all variables as views on row buffers
+		n = min([tail['rows'] for tail in self._tail.values()])
+		for tail in self._tail.values():
+			self._times = tail['data'][:n,0]
+			self._data[tail['variable']] = dict([(node,tail['data'][:n,icol+1]) for icol,node in enumerate(self.nodes)])
+		n0 = min(n0,n)
+		self._clear_derived()
+		new = dict([(var,dict([(node,self._data[var][node][n0:]) for node in self.nodes])) for var in self.variables])
+		return self._times[n0:],new
+	def follow(self,interval=dflt.sleep_time,timeout=None,callback=None):
+		'''Generator yielding new history data as they are written, e.g., while a simulation is running. The history files are checked for
+		new rows with increasing wait times, from dflt.sleep_time_min up to interval, while no new rows are found.
+		
+		:param interval: Longest wait (s) between checks for new data.
+		:type interval: fl64
+		:param timeout: Stop after this time (s) without new data. By default, continues until the generator is closed.
+		:type timeout: fl64
+		:param callback: Function called with new times and data before they are yielded.
+		:type callback: func
+		:returns: Tuples of new times and data, as returned by update().
+		'''
+		from time import sleep,time
+		wait = dflt.sleep_time_min
+		last = time()
+		while True:
+			times,data = self.update()
+			if len(times):
+				wait = dflt.sleep_time_min
+				last = time()
+				if callback: callback(times,data)
+				yield times,data
+			elif timeout is not None and time()-last > timeout: return
+			else: 
+				sleep(wait)
+				wait = min(2*wait,interval)
+	def _tail_header(self,fname):			#Read header of history file in follow mode, returns False if incomplete.
+		infile = open(fname,'r')
+		lines = []
+		for i in range(13):
+			line = infile.readline()
+			if not line.endswith('\n'): infile.close(); return False
+			lines.append(line)
+			self._detect_format(lines[0])
+			if self.format == 'surf' or (self.format == 'tec' and line.startswith('variables')) or (self.format == 'default' and line.startswith('Time ')): break
+		else: 
+			infile.close(); return False
+		offset = infile.tell()
+		infile.close()
+		if self.format == 'tec': 
+			self._setup_headers_tec(lines[-1]); var_key = fname.split('_')[-2]
+		elif self.format == 'surf': 
+			self._setup_headers_surf(lines[-1]); var_key = fname.split('_')[-2]
+		else: 
+			self._setup_headers_default(lines[-1]); var_key = fname.split('_')[-1].split('.')[0]
+		self.num_columns = len(self.nodes)+1
+		self._variables.append(hist_var_names[var_key])
+		self._tail[fname] = {'offset':offset,'variable':hist_var_names[var_key],'rows':0,'data':np.zeros((64,self.num_columns))}
+		return True
+	def _tail_rows(self,fname):			#Parse complete rows appended to history file since last read.
+		tail = self._tail[fname]
+		infile = open(fname,'rb')
+		infile.seek(tail['offset'])
+		text = infile.read()
+		infile.close()
+		end = text.rfind(b'\n')+1 			# incomplete last line read next time
+		if end == 0: return
+		tail['offset'] += end
+		lines = [ln for ln in text[:end].decode().split('\n') if ln.strip() and not ln.lstrip()[0].isalpha()] 	# skip tecplot text lines
+		if not lines: return
+		rows = np.array(' '.join(lines).replace(',',' ').split(),dtype=float).reshape(-1,self.num_columns)
+		# drop rows stepping back in time (FEHM repeats final output)
+		t_prev = tail['data'][tail['rows']-1,0] if tail['rows'] else -np.inf
+		keep = rows[:,0] >= np.maximum.accumulate(np.concatenate([[t_prev],rows[:,0]]))[:-1]
+		rows = rows[keep]
+		n = tail['rows']+rows.shape[0]
+		if n > tail['data'].shape[0]: 			# grow buffer
+			data = np.zeros((max(n,2*tail['data'].shape[0]),self.num_columns))
+			data[:tail['rows']] = tail['data'][:tail['rows']]
+			tail['data'] = data
+		tail['data'][tail['rows']:n] = rows
+		tail['rows'] = n
 	def time_plot(self, variable=None, node=0, t_lim=[],var_lim=[],marker='x-',color='k',save='',xlabel='',ylabel='',
 		title='',font_size='medium',scale=1.,scale_t=1.): 		# produce a time plot
 		'''Generate and save a time series plot of the history data.
@@ -1764,6 +2381,28 @@ class fhistory(object):						# Reading and plotting methods associated with hist
 			if name not in self._user_variables:
 				self._user_variables.append(name)
 		self._data[name][node] = data
+	def derived_variable(self,name,definition):
+		'''Defines a variable calculated from other variables when it is first accessed for a node, e.g., by fhistory[name][node] or time_plot(). 
+		Values are kept until the variable is redefined or new output is read by update().
+		
+		:param name: Name for the variable.
+		:type name: str
+		:param definition: Function taking the data for one node, time series indexed by variable name, and returning the time series of the variable, e.g., lambda d: d['T']+273.15. Alternatively, an expression in terms of variable names, e.g., 'T+273.15', in which NumPy is available as np. None removes the variable.
+		:type definition: func, str
+		'''
+		if name in self.variables or (name in self.user_variables and not isinstance(self._data.get(name),_derived_history)):
+			pyfehm_print('ERROR: there is already a variable called \''+name+'\', please choose a different name',self._silent)
+			return
+		self._clear_derived()
+		if definition is None:
+			if name in self._data: self._data.pop(name)
+			if name in self._user_variables: self._user_variables.remove(name)
+			return
+		self._data[name] = _derived_history(self,definition)
+		if name not in self._user_variables: self._user_variables.append(name)
+	def _clear_derived(self): 		# discard calculated values of derived variables
+		for var in self._user_variables:
+			if isinstance(self._data.get(var),_derived_history): self._data[var].clear()
 	def _get_variables(self): return self._variables
 	variables = property(_get_variables)#: (*lst[str]*) List of variables for which output data are available.
 	def _get_user_variables(self): return self._user_variables
@@ -1773,7 +2412,7 @@ class fhistory(object):						# Reading and plotting methods associated with hist
 	format = property(_get_format) #: (*str*) Format of output file, options are 'tec', 'surf', 'avs' and 'avsx'.
 	def _get_filename(self): return self._filename
 	filename = property(_get_filename)  #: (*str*) Name of FEHM contour output file. Wildcards can be used to define multiple input files.
-	def _get_times(self): return np.sort(self._times)
+	def _get_times(self): return _sorted_times(self)[0]
 	times = property(_get_times)	#: (*lst[fl64]*) List of times (in seconds) for which output data are available.
 	def _get_nodes(self): return self._nodes
 	nodes = property(_get_nodes)	#: (*lst[fl64]*) List of node indices for which output data are available.
@@ -1901,6 +2540,20 @@ class fnodeflux(object): 					# Reading and plotting methods associated with int
 		if key in self.nodepairs:
 			return self._data[key]
 		else: return None
+	def lookup(self,time,method='nearest',tolerance=None):
+		'''Returns internode fluxes for a time, found by binary search of the output times.
+		
+		:param time: Time for which output data are required.
+		:type time: fl64
+		:param method: 'nearest' output time, 'exact' output time, or 'linear' interpolation between the output times either side of time.
+		:type method: str
+		:param tolerance: Largest difference between time and the output time returned, as a fraction of the output time, for 'nearest' and 'exact' methods (zero for 'exact' by default).
+		:type tolerance: fl64
+		:returns: Fluxes indexed as the fnodeflux object, i.e., data[nodepair]['liquid'], or None if no output time found.
+		'''
+		weights = _time_weights(self,time,method,tolerance)
+		if weights is None: return None
+		return _weighted_data(self._data,weights)
 	def read(self,filename):
 		'''Read in FEHM contour output information.
 		
@@ -1940,7 +2593,7 @@ class fnodeflux(object): 					# Reading and plotting methods associated with int
 	def _get_timesteps(self): return np.sort(self._timesteps)
 	def _set_timesteps(self,value): self._timesteps = value
 	timesteps = property(_get_timesteps, _set_timesteps) #: (*lst*) timestep for which node flux information is reported.
-	def _get_times(self): return np.sort(self._times)
+	def _get_times(self): return _sorted_times(self)[0]
 	def _set_times(self,value): self._times = value
 	times = property(_get_times, _set_times) #: (*lst*) times for which node flux information is reported.
 	def _get_nodepairs(self): return self._nodepairs
@@ -2393,6 +3046,8 @@ class fvtk(object):
 		"""Assemble contour output in pyvtk objects."""
 		self.data.contour = dict([(time,pv.PointData()) for time in self.contour.times])
 		if self.diff: time0 = self.contour.times[0]
+		times = np.unique(self.contour.times)
+		ddt = {} 		# time derivatives of each variable
 		for time in self.contour.times:
 			do_lims = (time == self.contour.times[-1])
 			for var in self.contour.variables+self.contour.user_variables:
@@ -2415,28 +3070,9 @@ class fvtk(object):
 					self.data.contour[time].append(pv.Scalars(self.contour[time][var]-self.contour[time0][var],name='diff_'+var,lookup_table='default'))
 				# time derivatives
 				if self.time_derivatives:
-					# find position, determines type of differencing
-					ind = np.where(time==self.contour.times)[0][0]
-					if ind == 0: 
-						# forward difference
-						dt = self.contour.times[1]-time
-						f0 = self.contour[time][var]
-						f1 = self.contour[self.contour.times[1]][var]
-						dat = (f1-f0)/dt
-					elif ind == (len(self.contour.times)-1): 
-						# backward difference
-						dt = time-self.contour.times[-2]
-						f0 = self.contour[self.contour.times[-2]][var]
-						f1 = self.contour[time][var]
-						dat = (f1-f0)/dt
-					else:
-						# central difference
-						dt1 = time - self.contour.times[ind-1]
-						dt2 = self.contour.times[ind+1] - time
-						f0 = self.contour[self.contour.times[ind-1]][var]
-						f1 = self.contour[time][var]
-						f2 = self.contour[self.contour.times[ind+1]][var]
-						dat = -dt2/(dt1*(dt1+dt2))*f0 + (dt2-dt1)/(dt1*dt2)*f1 + dt1/(dt2*(dt1+dt2))*f2
+					# forward, central and backward differences for all times at once
+					if var not in ddt: ddt[var] = np.gradient(self.contour.array(var),times,axis=0)
+					dat = ddt[var][np.searchsorted(times,time)]
 					self.data.contour[time].append(pv.Scalars(dat,name='d_'+var+'_dt',lookup_table='default'))
 			if 'flux_x' in self.contour.variables and 'flux_y' in self.contour.variables and 'flux_z' in self.contour.variables:
 				flux = [(self.contour[time]['flux_x'][i],self.contour[time]['flux_y'][i],self.contour[time]['flux_z'][i]) for i in range(len(self.contour[time]['flux_x']))]
@@ -3109,5 +3745,124 @@ def sort_tec_files(files):
 	files = [files[ind] for ind,time in times]
 
 	return [path+os.sep+file if path else file for path,file in zip(paths,files)]
+def _evaluate_derived(definition,data): 		# derived variable from function of, or expression in, variables in data
+	if callable(definition): return definition(data)
+	return eval(definition,{'np':np},data)
+def _plane_normals(azimuth,dip): 		# unit normals of planes with azimuth (relative to x) and dip in degrees
+	azi = np.atleast_1d(azimuth)/180.*np.pi+np.pi/2.
+	dip = np.atleast_1d(dip)/180.*np.pi
+	azi,dip = np.broadcast_arrays(azi,dip)
+	return np.array([np.cos(azi)*np.sin(dip),np.sin(azi)*np.sin(dip),np.cos(dip)]).T
+def _principal_values(sxx,syy,szz,sxy,sxz,syz): 		# eigenvalues of symmetric 3x3 arrays, largest first, in closed form (trigonometric solution)
+	q = (sxx+syy+szz)/3.
+	p1 = sxy**2+sxz**2+syz**2
+	p = np.sqrt(((sxx-q)**2+(syy-q)**2+(szz-q)**2+2.*p1)/6.)
+	ps = np.where(p>0.,p,1.)
+	bxx,byy,bzz = (sxx-q)/ps,(syy-q)/ps,(szz-q)/ps
+	bxy,bxz,byz = sxy/ps,sxz/ps,syz/ps
+	r = 0.5*(bxx*(byy*bzz-byz**2)-bxy*(bxy*bzz-byz*bxz)+bxz*(bxy*byz-byy*bxz))
+	phi = np.arccos(np.clip(r,-1.,1.))/3.
+	s1 = q+2.*p*np.cos(phi)
+	s3 = q+2.*p*np.cos(phi+2.*np.pi/3.)
+	return np.array([s1,3.*q-s1-s3,s3])
+def _interpolation_matrix(points,pointsI,method): 		# sparse matrix of nearest point, or barycentric weights of Delaunay simplex, for each of pointsI
+	from scipy.sparse import csr_matrix
+	if method == 'nearest':
+		from scipy.spatial import cKDTree
+		inds = cKDTree(points).query(pointsI)[1]
+		return csr_matrix((np.ones(len(pointsI)),(np.arange(len(pointsI)),inds)),shape=(len(pointsI),len(points)))
+	from scipy.spatial import Delaunay
+	tri = Delaunay(points)
+	simplex = tri.find_simplex(pointsI)
+	ndim = points.shape[1]
+	transform = tri.transform[simplex]
+	weights = np.einsum('ijk,ik->ij',transform[:,:ndim,:],pointsI-transform[:,ndim,:])
+	weights = np.column_stack([weights,1.-weights.sum(axis=1)])
+	inds = tri.simplices[simplex]
+	outside = simplex == -1 		# outside convex hull, not a number as for griddata
+	weights[outside] = 0.
+	weights[outside,0] = np.nan
+	inds[outside] = 0
+	rows = np.repeat(np.arange(len(pointsI)),ndim+1)
+	return csr_matrix((weights.flatten(),(rows,inds.flatten())),shape=(len(pointsI),len(points)))
+def _sorted_times(obj): 		# output times in increasing order, and their positions in obj._times, sorted again only when obj._times changes
+	# obj._times is replaced when output is read or updated, or appended to, so the object and its length identify its contents
+	cached = obj.__dict__.get('_times_sorted')
+	if cached is None or cached[2] is not obj._times or cached[3] != len(obj._times):
+		times = np.asarray(obj._times,dtype=float)
+		order = np.argsort(times,kind='stable')
+		sorted_times = times[order]
+		sorted_times.flags.writeable = False
+		obj._times_sorted = (sorted_times,order,obj._times,len(obj._times))
+	return obj._times_sorted[:2]
+def _time_weights(obj,time,method='nearest',tolerance=None):	# positions in obj._times, and weights, of output for a time, None if not found
+	times,order = _sorted_times(obj)
+	if len(times) == 0: return None
+	i = np.searchsorted(times,time)
+	if i < len(times) and times[i] == time: return [(order[i],1.)]
+	if method == 'linear':
+		if i == 0 or i == len(times): return None
+		weight = (time-times[i-1])/(times[i]-times[i-1])
+		return [(order[i-1],1.-weight),(order[i],weight)]
+	if method not in ['nearest','exact']: 
+		pyfehm_print('ERROR: unrecognised method \''+str(method)+'\', options are \'nearest\', \'exact\' and \'linear\'',dflt.silent)
+		return None
+	if method == 'exact' and tolerance is None: return None
+	if i == len(times) or (i > 0 and time-times[i-1] <= times[i]-time): i -= 1
+	if tolerance is not None and abs(times[i]-time) > tolerance*abs(times[i]): return None
+	return [(order[i],1.)]
+def _weighted_data(data,weights): 		# time series, or dictionaries of them, at weighted positions
+	if isinstance(data,dict): return dict([(key,_weighted_data(value,weights)) for key,value in data.items()])
+	if len(weights) == 1: return data[weights[0][0]]
+	return sum([weight*data[i] for i,weight in weights])
+def _contour_cache_directory(files): 		# binary cache for a set of contour output files, next to the files
+	return os.path.dirname(os.path.abspath(files[0]))+os.sep+'pyfehm_contour_cache'+os.sep+content_hash(*[os.path.abspath(file) for file in files])
+def _contour_file_signatures(files): 		# size and modification time of files, changed if files rewritten
+	return [[os.path.abspath(file),os.path.getsize(file),os.path.getmtime(file)] for file in files]
+_contour_worker = None
+def _contour_worker_init(state): 			# contour object in worker process, holding format, variables and first time coordinates
+	global _contour_worker
+	_contour_worker = fcontour.__new__(fcontour)
+	_contour_worker.__dict__.update(state)
+def _contour_worker_read(files): 			# read one group of contour files in worker process, return time, data and names of shared coordinates
+	cont = _contour_worker
+	time0 = cont._times[0]
+	first = cont._data[time0]
+	cont._read_group(files,None)
+	if len(cont._times) == 1: return None,None,[]
+	time = cont._times[-1]
+	data = cont._data[time]
+	cont._times = [time0]
+	cont._data = {time0:first}
+	shared = [var for var in ['n','x','y','z'] if var in data and data[var] is first.get(var)]
+	for var in shared: data.pop(var)
+	return time,data,shared
+def _file_time(file): 			# output time from contour file name
+	file = file.split('_node')[0]
+	file = file.split('_sca')[0]
+	file = file.split('_con')[0]
+	file = file.split('_vec')[0]
+	file = file.split('_hf')[0]
+	file = file.split('_days')[0]
+	file = [fl for fl in file.split('.') if fl.isdigit() or 'E-' in fl]
+	return float('.'.join(file))
+def _parse_block(lns,delimiter=None,skip=0):		# parse lines of numbers into array, unreadable values (e.g., malformed exponents) are zero as for float0
+	# the first skip columns (e.g., coordinates already read from another file) are not converted
+	while lns and not lns[-1].strip(): lns = lns[:-1]
+	if not lns: return np.zeros((0,0))
+	ncol = len(lns[0].split(delimiter))
+	try: return np.loadtxt(lns,delimiter=delimiter,usecols=range(skip,ncol),comments=None,ndmin=2)
+	except ValueError: pass
+	# unreadable values, or missing values or uneven lines
+	text = ''.join(lns)
+	if delimiter: text = text.replace(delimiter,' ')
+	values = text.split()
+	if len(values) != ncol*len(lns): 
+		return np.array([[float0(d) for d in ln.strip().split(delimiter)[skip:]] for ln in lns if ln.strip()])
+	blocks = [] 			# only blocks containing unreadable values converted one value at a time
+	for i in range(0,len(values),10000):
+		try: blocks.append(np.array(values[i:i+10000],dtype=float))
+		except ValueError: blocks.append(np.array([float0(d) for d in values[i:i+10000]]))
+	return np.concatenate(blocks).reshape(len(lns),ncol)[:,skip:]
 	
 	
@@ -22,7 +22,7 @@ Public License for more details.
 """
 
 import numpy as np
-import os,math,platform,string,difflib
+import os,math,platform,string,difflib,hashlib
 WINDOWS = platform.system()=='Windows'
 if WINDOWS: slash = '\\'
 else: slash = '/'
@@ -347,6 +347,18 @@ def os_path(path):
 def float0(f):
 	try: return float(f)
 	except: return 0.
+def content_hash(*items):					#returns a digest of arrays and other objects, used to detect unchanged data
+	h = hashlib.md5()
+	for item in items:
+		if isinstance(item,np.ndarray):
+			h.update(str((item.dtype,item.shape)).encode())
+			h.update(np.ascontiguousarray(item).tobytes())
+		elif isinstance(item,bytes):
+			h.update(item)
+		else:
+			h.update(repr(item).encode())
+		h.update(b'|')
+	return h.hexdigest()
 def _title_string(s,n): 						#prepends headers to sections of FEHM input file
 	if not n: return
 	ws = '# '
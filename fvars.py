@@ -1000,12 +1000,13 @@ def fluid_column(z,Tgrad,Tsurf,Psurf,iterations = 3):
         Pco2 = Psurf + Pgrad*z
     Ph = Psurf + Phgrad*z
     
-    for i in range(iterations):
+    dz = np.diff(z)
+    for i in range(iterations):		# cumulative trapezoidal integration of density down the column
         if co2Vars:
             rho = dens(Pco2,T)[2]
-            Pco2=np.array([(abs(np.trapz(rho[:i+1],z[:i+1]))*9.81/1e6)+Pco2[0] for i in range(len(rho))])
+            Pco2 = np.concatenate([[0.],abs(np.cumsum((rho[1:]+rho[:-1])/2.*dz))])*9.81/1e6+Pco2[0]
         rho = dens(Ph,T)[0]
-        Ph=np.array([(abs(np.trapz(rho[:i+1],z[:i+1]))*9.81/1e6)+Ph[0] for i in range(len(rho))])
+        Ph = np.concatenate([[0.],abs(np.cumsum((rho[1:]+rho[:-1])/2.*dz))])*9.81/1e6+Ph[0]
     
     if co2Vars:
         rho = dens(Pco2,T)
@@ -1,6 +1,7 @@
 
 print('Testing imports')
 from fdata import*
+from tempfile import mkdtemp
 
 # test reading of internode fluxes
 ndflx = fnodeflux('run.internode_fluxes.out')
@@ -253,6 +254,467 @@ def test_input():
 	dat.run()
 	
 	return True
+def stub_executable(filename,source):
+	# python script standing in for FEHM, reads file names from fehmn.files in the current directory
+	fp = open(filename,'w')
+	fp.write('#!'+sys.executable+'\n')
+	fp.write('fs = dict([ln.split(\':\',1) for ln in open(\'fehmn.files\') if \':\' in ln])\n')
+	fp.write('fs = dict([(k.strip(),v.strip()) for k,v in fs.items()])\n')
+	fp.write(source)
+	fp.close()
+	os.chmod(filename,0o755)
+	return os.path.abspath(filename)
+
+def test_cache():
+	# output restored from the cache is that of the matching run, after other runs rewrite files in the work directory
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	exe = stub_executable('fehm_stub',
+		'lns = open(fs[\'input\']).read().split(\'\\n\')\n'+
+		'tf = float(lns[lns.index(\'time\')+1].split()[1])\n'+
+		'open(\'m.outp\',\'w\').write(\'result for tf=\'+str(tf)+\'\\n\')\n'+
+		'open(fs[\'rsto\'],\'w\').write(str(tf)+\'\\n\')\n')
+	cache = fcache('cache')
+	dat = fdata(work_dir='wd')
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=[0,1,2],y=[0,1],z=[0,1])
+	results = []
+	for tf in [10.,20.,10.]:
+		dat.tf = tf
+		dat.run('pyfehm_unittest_INPUT.dat',exe=exe,cache=cache,verbose=False)
+		results.append(open('wd'+os.sep+'m.outp').read().strip())
+	os.chdir(cwd)
+	if cache.stats['hits'] != 1 or cache.stats['misses'] != 2: print('cache hits/misses wrong'); return False
+	if results != ['result for tf=10.0','result for tf=20.0','result for tf=10.0']: print('cached output changed by later run'); return False
+	return True
+
+def test_grid_links():
+	# grid files shared between runs by hard links have the same format, and are not changed by writing another run's grid
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	exe = stub_executable('fehm_stub','')
+	models = [fdata(work_dir=wd) for wd in ['a','b','c']]
+	for dat,grid in zip(models,['g.inp','g.avs','g.inp']):
+		dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=[0,1,2],y=[0,1],z=[0,1])
+		dat.run('pyfehm_unittest_INPUT.dat',grid=grid,exe=exe,verbose=False)
+	fehm = open('a'+os.sep+'g.inp').read()
+	avs = open('b'+os.sep+'g.avs').read()
+	linked = os.path.samefile('a'+os.sep+'g.inp','c'+os.sep+'g.inp')
+	models[2].grid.write('c'+os.sep+'g.inp',format='avs')
+	changed = open('a'+os.sep+'g.inp').read() != fehm
+	os.chdir(cwd)
+	if not fehm.startswith('coor') or avs.startswith('coor'): print('grid file linked across formats'); return False
+	if not linked: print('identical grid files not linked'); return False
+	if changed: print('linked grid file changed by write'); return False
+	return True
+
+def attached_grid_sum(name):
+	# pool worker, uses grid data attached from shared memory before and after unpublish()
+	grid = fgrid().attach(name)
+	x = grid.node[5].position[0]
+	grid.unpublish()
+	return x+grid.node[5].position[0]+np.sum(grid.node_array('position'))
+def test_publish():
+	# grid published to shared memory is used by pool workers, and stays usable in attached grids after unpublish()
+	import multiprocessing
+	if 'fork' not in multiprocessing.get_all_start_methods(): return True 		# spawned workers would rerun this script
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=np.linspace(0,10,11),y=np.linspace(0,10,6),z=np.linspace(0,5,4))
+	name = dat.grid.publish()
+	pool = multiprocessing.get_context('fork').Pool(2)
+	try: results = pool.map_async(attached_grid_sum,[name]*4).get(timeout=60)
+	finally: 
+		pool.close()
+		pool.join()
+	grid = fgrid().attach(name)
+	nd = grid.node[5]
+	dat.grid.unpublish()
+	expected = 2*dat.grid.node[5].position[0]+np.sum([nd.position for nd in dat.grid.nodelist])
+	if not np.allclose(results,expected): print('wrong data in workers'); return False
+	if not np.allclose(nd.position,dat.grid.node[5].position) or grid.node_array('position').shape != (264,3): 
+		print('attached data lost'); return False
+	try: fgrid().attach(name)
+	except FileNotFoundError: return True
+	print('shared memory not removed'); return False
+def test_macro_runs():
+	# single node macros merged into JA JB JC ranges are written to, and read back from, the correct file
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=np.linspace(0,10,11),y=[0,1],z=[0,1])
+	perm = {}
+	for nd in dat.grid.nodelist[:20]:
+		perm[nd.index] = 1.e-12 if nd.index in [4,5] else 1.e-14
+		if nd.index%2: file = 'pyfehm_unittest_PERM.dat'
+		else: file = None
+		dat.add(fmacro('perm',zone=(nd.index,nd.index,1),param=(('kx',perm[nd.index]),('ky',perm[nd.index]),('kz',perm[nd.index])),file=file))
+	dat.write('pyfehm_unittest_INPUT.dat')
+	dat = fdata('pyfehm_unittest_INPUT.dat','pyfehm_unittest_GRID.inp')
+	os.chdir(cwd)
+	macros = [macro for macro in dat.permlist if isinstance(macro.zone,tuple)]
+	if len(macros) != 6: print('single node macros not merged'); return False
+	for macro in macros:
+		nds = range(macro.zone[0],macro.zone[1]+1,macro.zone[2])
+		if any([perm[nd] != macro.param['kx'] for nd in nds]): print('merged macro has wrong permeability'); return False
+		if any([(nd%2 == 1) != (macro.file == 'pyfehm_unittest_PERM.dat') for nd in nds]): print('merged macro in wrong file'); return False
+	if sorted([nd for macro in macros for nd in range(macro.zone[0],macro.zone[1]+1,macro.zone[2])]) != sorted(perm.keys()): 
+		print('merged macros missing nodes'); return False
+	return True
+
+def test_clone():
+	# clones share the grid, but node properties assigned in one model do not change the others
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=np.linspace(0,10,11),y=[0,1],z=[0,1])
+	dat.new_zone(1,'res',rect=[[0,0,0],[5,1,1]],permeability=1.e-14,Pi=1.)
+	clones = [dat.clone() for i in range(2)]
+	if clones[0].grid.nodelist is not dat.grid.nodelist: print('grid not shared'); return False
+	clones[0].zone['res'].permeability = 5.e-15
+	clones[0].zone['res'].Pi = 2.
+	clones[1].add(fmacro('rock',zone=clones[1].zone['res'],param=(('density',2000.),('specific_heat',1000.),('porosity',0.2))))
+	for model,k,P,rho in zip([dat,clones[0],clones[1]],[1.e-14,5.e-15,1.e-14],[1.,2.,1.],[None,None,2000.]):
+		nd = model.zone['res'].nodelist[0]
+		if nd is not model.grid.node[nd.index]: print('zone node not in model grid'); return False
+		if nd.permeability[0] != k: print('clone permeability shared'); return False
+		if nd.Pi != P: print('clone initial pressure shared'); return False
+		if rho and nd.density != rho: print('clone density shared'); return False
+	if dat.grid.nodelist[0].density == 2000.: print('clone density shared'); return False
+	# a clone whose grid containers were copied by add_node still shares its node objects
+	clone = dat.clone()
+	clone.grid.add_node(fnode(index=len(dat.grid.nodelist)+1,position=[11.,0.,0.]))
+	if len(dat.grid.nodelist) == len(clone.grid.nodelist): print('added node shared'); return False
+	clone.zone['res'].permeability = 2.e-15
+	clone.add(fmacro('rock',zone=clone.zone['res'],param=(('density',2500.),('specific_heat',1000.),('porosity',0.2))))
+	for nd in dat.zone['res'].nodelist:
+		if nd.permeability[0] != 1.e-14: print('permeability shared after add_node'); return False
+		if nd.density == 2500.: print('density shared after add_node'); return False
+	nd = clone.zone['res'].nodelist[0]
+	if nd.permeability[0] != 2.e-15 or nd.density != 2500.: print('clone properties not set'); return False
+	return True
+
+def test_run_ensemble():
+	# ensemble members created by a generator run in their own directories, results in the order given
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	exe = stub_executable('fehm_stub',
+		'import os,sys\n'+
+		'lns = open(fs[\'input\']).read().split(\'\\n\')\n'+
+		'tf = float(lns[lns.index(\'time\')+1].split()[1])\n'+
+		'print(\'cwd \'+os.getcwd())\n'+
+		'if tf == 30.: sys.exit(3)\n'+
+		'open(fs[\'rsto\'],\'w\').write(str(tf)+\'\\n\')\n')
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=[0,1,2],y=[0,1],z=[0,1])
+	def models():
+		for i in range(5):
+			model = dat.clone()
+			model.tf = 10.*(i+1)
+			yield model
+	results = run_ensemble(models(),exe=exe,processes=2)
+	work_dir = os.path.abspath('ensemble')
+	if os.getcwd() != os.path.dirname(work_dir): print('working directory changed'); return False
+	os.chdir(cwd)
+	if [result['name'] for result in results] != ['run1','run2','run3','run4','run5']: print('results out of order'); return False
+	if [result['returncode'] for result in results] != [0,0,3,0,0]: print('wrong return codes'); return False
+	for i,result in enumerate(results):
+		if result['work_dir'] != work_dir+os.sep+result['name']: print('wrong work directory'); return False
+		if open(result['log']).read().strip() != 'cwd '+result['work_dir']: print('wrong log'); return False
+		if i == 2:
+			if result['rsto'] is not None or not result['error']: print('failure not reported'); return False
+		elif result['error'] or open(result['rsto']).read().strip() != str(10.*(i+1)): print('wrong restart file'); return False
+	return True
+def test_section_cache():
+	# input file sections reused from an earlier write are rewritten when the data they hold change
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=np.linspace(0,10,11),y=[0,1],z=[0,1])
+	dat.new_zone(1,'res',rect=[[0,0,0],[5,1,1]],permeability=1.e-14,Pi=1.)
+	dat.write('pyfehm_unittest_INPUT1.dat')
+	dat.zone['res'].permeability = 5.e-15
+	dat.zone['res'].rect([0,0,0],[2,1,1])
+	dat.pres[1].param['pressure'] = 2.
+	dat.tf = 50.
+	dat.write('pyfehm_unittest_INPUT2.dat')
+	dat._section_cache = {}
+	dat.write('pyfehm_unittest_INPUT3.dat')
+	text1,text2,text3 = [open('pyfehm_unittest_INPUT'+str(i)+'.dat').read().split('\n',1)[1] for i in [1,2,3]]
+	os.chdir(cwd)
+	if text2 != text3: print('cached sections out of date'); return False
+	if text1 == text2: print('changes not written'); return False
+	return True
+def test_incon_round_trip():
+	# restart data read back as written, and written again in the same layout
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=np.linspace(0,10,5),y=np.linspace(0,10,5),z=np.linspace(0,-10,7))
+	n = dat.grid.number_nodes
+	np.random.seed(0)
+	T = np.random.rand(n)*100.; P = np.random.rand(n)*10.; S = np.ones(n)
+	dat.incon._T = T; dat.incon._P = P; dat.incon._S = S
+	dat.incon._time = 12.5; dat.incon._source = 'pyfehm_unittest'
+	dat.incon.write('pyfehm_unittest_INCON1.ini')
+	dat.incon.read('pyfehm_unittest_INCON1.ini')
+	dat.incon.write('pyfehm_unittest_INCON2.ini')
+	text1,text2 = [open('pyfehm_unittest_INCON'+str(i)+'.ini').read().split('\n') for i in [1,2]]
+	os.chdir(cwd)
+	if not (np.allclose(dat.incon.T,T) and np.allclose(dat.incon.P,P) and np.allclose(dat.incon.S,S)): print('restart data changed'); return False
+	if dat.incon.time != 12.5: print('restart time changed'); return False
+	if text1[1:] != text2[1:]: print('restart layout changed'); return False
+	block = text1[text1.index('temperature')+1:text1.index('saturation')]
+	if [len(ln.split()) for ln in block] != [4]*(n//4)+([n%4] if n%4 else []): print('not four values per line'); return False
+	return True
+def test_save_load():
+	# model restored from an archive writes the same input file, and saving does not change the model
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=np.linspace(0,10,11),y=[0,1],z=[0,1])
+	dat.new_zone(1,'res',rect=[[0,0,0],[5,1,1]],permeability=1.e-14,density=2000.,Pi=1.)
+	dat.tf = 50.
+	dat.write('pyfehm_unittest_INPUT1.dat')
+	dat.save('pyfehm_unittest.pfa')
+	dat.write('pyfehm_unittest_INPUT2.dat')
+	loaded = fdata().load('pyfehm_unittest.pfa')
+	loaded.write('pyfehm_unittest_INPUT3.dat')
+	texts = [open('pyfehm_unittest_INPUT'+str(i)+'.dat').read().split('\n',1)[1] for i in [1,2,3]]
+	os.chdir(cwd)
+	if texts[1] != texts[0]: print('model changed by save'); return False
+	if texts[2] != texts[0]: print('loaded model differs'); return False
+	nd = loaded.zone['res'].nodelist[0]
+	if nd is not loaded.grid.node[nd.index]: print('zone nodes not in loaded grid'); return False
+	if nd.permeability[0] != 1.e-14 or nd.density != 2000.: print('node properties not loaded'); return False
+	return True
+def contour_files(times,T):
+	# AVS contour output for 5 nodes, one file per time
+	for i,(time,Ti) in enumerate(zip(times,T)):
+		fp = open('pyfehm_unittest.%05i_sca_node.avs'%time,'w')
+		fp.write('5 1 1 1 1 1\nX coordinate (m), no dimension\nY coordinate (m), no dimension\nZ coordinate (m), no dimension\n')
+		fp.write('Liquid Pressure (MPa), no dimension\nTemperature (deg C), no dimension\n')
+		for nd in range(5): fp.write('%i %f 0. 0. 1. %f\n'%(nd+1,nd,Ti+nd))
+		fp.close()
+def test_contour_cache():
+	# contour output read from the binary cache matches that read from file, and the cache is not used once files change
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	contour_files([1,2,4],[10.,20.,40.])
+	files = 'pyfehm_unittest.*_node.avs'
+	c1 = fcontour(files,cache=True)
+	c2 = fcontour(files,cache=True)
+	cached = isinstance(c2._data._arrays.get('T'),np.memmap)
+	contour_files([4],[150.]) 		# size changed, as modification times may not be
+	c3 = fcontour(files,cache=True)
+	os.chdir(cwd)
+	if not cached: print('cache not used'); return False
+	if list(c1.times) != list(c2.times) or c1.variables != c2.variables: print('cached times or variables differ'); return False
+	for time in c1.times:
+		for var in c1[time]:
+			if not np.array_equal(c1[time][var],c2[time][var]): print('cached data differ'); return False
+	if c3[4]['T'][0] != 150.: print('out of date cache used'); return False
+	return True
+def test_time_lookup():
+	# output times found by exact, nearest and linear lookup
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	contour_files([4,1,2],[40.,10.,20.])
+	c = fcontour('pyfehm_unittest.*_node.avs')
+	os.chdir(cwd)
+	if list(c.times) != [1.,2.,4.]: print('times not sorted'); return False
+	if c[2.01]['T'][0] != 20. or c[3.] is not None: print('wrong item lookup'); return False
+	if c.lookup(2.,'exact')['T'][0] != 20. or c.lookup(2.01,'exact') is not None: print('wrong exact lookup'); return False
+	if c.lookup(2.01,'exact',tolerance=0.01)['T'][0] != 20.: print('wrong exact lookup with tolerance'); return False
+	if c.lookup(3.4)['T'][0] != 40. or c.lookup(100.)['T'][0] != 40.: print('wrong nearest lookup'); return False
+	if c.lookup(3.4,'nearest',tolerance=0.1) is not None: print('wrong nearest lookup with tolerance'); return False
+	if not np.allclose(c.lookup(3.,'linear')['T'],[30.,31.,32.,33.,34.]) or c.lookup(5.,'linear') is not None: print('wrong linear lookup'); return False
+	f = fnodeflux()
+	f._times = [3.,1.,2.]; f._nodepairs = [(1,2)]; f._data = {(1,2):{'liquid':np.array([30.,10.,20.]),'vapor':np.zeros(3)}}
+	if f.lookup(3.,'exact')[(1,2)]['liquid'] != 30.: print('wrong flux lookup'); return False
+	f._times.append(0.5); f._data[(1,2)] = {'liquid':np.array([30.,10.,20.,5.]),'vapor':np.zeros(4)} 		# appended, as when output read
+	if f.lookup(0.5,'exact')[(1,2)]['liquid'] != 5. or list(f.times) != [0.5,1.,2.,3.]: print('times not sorted again after append'); return False
+	f._times = [3.,1.,2.] 		# replaced, as when output read again
+	if list(f.times) != [1.,2.,3.]: print('times not sorted again after change'); return False
+	return True
+def test_contour_follow():
+	# contour output read as it is written, quietly after the first files
+	from io import StringIO
+	from contextlib import redirect_stdout
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	contour_files([1,2],[10.,20.])
+	c = fcontour('pyfehm_unittest.*_node.avs',follow=True)
+	out = StringIO()
+	with redirect_stdout(out): new = c.update()
+	os.chdir(cwd)
+	if len(new) != 1 or list(c.times) != [1.,2.]: print('output times not followed'); return False
+	if out.getvalue(): print('output printed on update'); return False
+	return True
+def test_parse_block():
+	# values with malformed exponents read as zero, leading columns skipped on request
+	from fpost import _parse_block
+	lns = ['1 0.5 1. 2. 3.5\n','2 1.5 1. 2. 1.234-100\n','3 2.5 1. 2. 7.\n','\n']
+	data = _parse_block(lns)
+	if data.shape != (3,5) or data[1,4] != 0. or data[2,4] != 7.: print('malformed exponent not read as zero'); return False
+	if not np.array_equal(_parse_block(lns,skip=4),data[:,4:]): print('wrong columns skipped'); return False
+	lns = [ln.replace(' ',', ') for ln in lns]
+	if not np.array_equal(_parse_block(lns,',',skip=1),data[:,1:]): print('wrong columns skipped with delimiter'); return False
+	if not np.array_equal(_parse_block(lns[::2],',',skip=1),data[::2,1:]): print('readable values changed'); return False
+	return True
+
+def test_stressgrad():
+	# vertical stress integrated from node densities, which must all be defined
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=np.linspace(0,10,4),y=np.linspace(0,10,5),z=np.linspace(0,-10,7))
+	dat.incon._path.filename = 'pyfehm_unittest_INCON.ini'
+	dat.incon.stressgrad(0.5,0.6,3.,calculate_vertical=True)
+	if len(dat.incon.strs_zz): print('vertical stress calculated without density'); return False
+	dat.zone[0].density = 2500.
+	dat.incon.stressgrad(0.5,0.6,3.,calculate_vertical=True)
+	z = np.array([nd.position[2] for nd in dat.grid.nodelist])
+	if not np.allclose(dat.incon.strs_zz,3.-9.81*2500.*z/1.e6): print('wrong vertical stress'); return False
+	return True
+
+def stress_contour_files(times):
+	# AVS contour output with pressure and stress at the nodes of a 4x4x3 grid, one file per time
+	names = ['Liquid Pressure','X stress','Y stress','Z stress','XY stress','XZ stress','YZ stress']
+	x,y,z = [xi.flatten() for xi in np.meshgrid(np.linspace(0,3,4),np.linspace(0,3,4),np.linspace(0,2,3),indexing='ij')]
+	for time in times:
+		np.random.seed(time)
+		vals = np.random.rand(len(x),len(names))*[5.,-20.,-20.,-30.,5.,5.,5.]
+		fp = open('pyfehm_unittest.%05i_sca_node.avs'%time,'w')
+		fp.write(str(3+len(names))+' 1'*(3+len(names))+'\n')
+		for name in ['X coordinate (m)','Y coordinate (m)','Z coordinate (m)']+[name+' (MPa)' for name in names]: fp.write(name+', no dimension\n')
+		for nd in range(len(x)): fp.write(('%i %f %f %f'+' %f'*len(names)+'\n')%((nd+1,x[nd],y[nd],z[nd])+tuple(vals[nd])))
+		fp.close()
+def test_stress_output():
+	# Coulomb failure stress at nodes as for slice() with a 'cfs' variable, principal stresses as eigenvalues of the stress tensor
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	stress_contour_files([1,2])
+	c = fcontour('pyfehm_unittest.*_node.avs')
+	os.chdir(cwd)
+	dat = c[2]
+	for azimuth,dip in [(30.,60.),(0.,90.),(120.,45.)]:
+		X,Y,Z,cfs = c.slice(['cfs',azimuth,dip,0.6,0.1],['z',1.],[4,4],2,'nearest')
+		nds = [np.where((dat['x']==xi)&(dat['y']==yi)&(dat['z']==1.))[0][0] for xi,yi in zip(X.flatten(),Y.flatten())]
+		if not np.allclose(c.cfs(azimuth,dip,0.6,0.1,times=[2])[0][nds],cfs.flatten(),rtol=1.e-4): print('cfs differs from slice'); return False
+	cfs = c.cfs([30.,0.],[60.,90.],0.6,0.1)
+	if cfs.shape != (2,2,48) or not np.allclose(cfs[1],c.cfs(0.,90.,0.6,0.1)): print('wrong cfs for several orientations'); return False
+	S = np.array([[c.array('strs_xx'),c.array('strs_xy'),c.array('strs_xz')],[c.array('strs_xy'),c.array('strs_yy'),c.array('strs_yz')],
+		[c.array('strs_xz'),c.array('strs_yz'),c.array('strs_zz')]]).transpose((2,3,0,1))
+	eig = np.moveaxis(np.linalg.eigvalsh(S)[...,::-1],-1,0)
+	if not np.allclose(c.principal_stresses(),eig): print('wrong principal stresses'); return False
+	values,vectors = c.principal_stresses(vectors=True)
+	if not np.allclose(values,eig) or not np.allclose(np.einsum('tnij,tnj->tni',S,vectors[...,0]),values[0][...,None]*vectors[...,0]): print('wrong principal directions'); return False
+	s1,s2,s3 = eig
+	if not np.allclose(c.cfs(friction=0.6),0.5*(s1-s3)*np.sqrt(1.36)-0.6*(0.5*(s1+s3)-c.array('P'))): print('wrong cfs on optimal planes'); return False
+	return True
+
+def test_interpolation():
+	# slices and profiles interpolated as by griddata, with one interpolation matrix for all variables and times
+	from scipy.interpolate import griddata
+	from fpost import _interpolation_matrix
+	np.random.seed(0)
+	points = np.random.rand(60,3)
+	pointsI = np.random.rand(40,3)*1.2-0.1 		# some outside convex hull
+	vals = np.random.rand(60)
+	for method in ['nearest','linear']:
+		if not np.allclose(_interpolation_matrix(points,pointsI,method).dot(vals),griddata(points,vals,pointsI,method=method),equal_nan=True): 
+			print('interpolation differs from griddata'); return False
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	stress_contour_files([1,2])
+	c = fcontour('pyfehm_unittest.*_node.avs')
+	os.chdir(cwd)
+	matrices = []
+	for time,var in [(1,'P'),(2,'P'),(2,'strs_xx')]:
+		X,Y,Z,valsI = c.slice(var,['z',1.],[7,5],time,'linear')
+		matrices += list(c._interpolators.values())
+		dat = c[time]
+		valsG = griddata(np.transpose([dat['x'],dat['y'],dat['z']]),dat[var],np.transpose([X.flatten(),Y.flatten(),Z.flatten()]),method='linear')
+		if not np.allclose(valsI.flatten(),valsG): print('slice differs from griddata'); return False
+	if len(matrices) != 3 or any([matrix is not matrices[0] for matrix in matrices]): print('interpolation matrix not reused'); return False
+	return True
+
+def test_derived_variable():
+	# derived contour variables available through node lookup, slices and VTK export, and calculated again when redefined
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	stress_contour_files([1,2])
+	c = fcontour('pyfehm_unittest.*_node.avs')
+	os.chdir(cwd)
+	c.derived_variable('seff','strs_zz-P')
+	c.derived_variable('smean',lambda d: (d['strs_xx']+d['strs_yy']+d['strs_zz'])/3.)
+	seff = c.array('strs_zz')-c.array('P')
+	if not np.allclose(c.node(5,variable='seff'),seff[:,4]) or c.node(5,2.,'seff') != seff[1,4]: print('wrong derived node values'); return False
+	X,Y,Z,valsI = c.slice('seff',['z',1.],[4,4],2,'nearest')
+	if not np.allclose(valsI,c.slice('strs_zz',['z',1.],[4,4],2,'nearest')[3]-c.slice('P',['z',1.],[4,4],2,'nearest')[3]): print('wrong derived slice'); return False
+	os.chdir(mkdtemp())
+	dat = fdata()
+	dat.grid.make(gridfilename='pyfehm_unittest_GRID.inp',x=np.linspace(0,3,4),y=np.linspace(0,3,4),z=np.linspace(0,2,3))
+	dat.write_vtk('pyfehm_unittest.vtk',contour=c,diff=False)
+	texts = [open(file).read() for file in dat._vtk.contour_files]
+	c.derived_variable('seff','strs_zz-2*P')
+	redefined = c[2]['seff']
+	os.chdir(cwd)
+	if len(texts) != 2 or not all(['SCALARS seff' in text and 'SCALARS smean' in text for text in texts]): print('derived variables not exported'); return False
+	values = texts[1].split('SCALARS seff')[1].split('LOOKUP_TABLE default')[1].split()[:48]
+	if not np.allclose(np.array(values,dtype=float),seff[1],rtol=1.e-5): print('wrong exported values'); return False
+	if not np.allclose(redefined,c[2]['strs_zz']-2*c[2]['P']): print('derived variable not calculated again'); return False
+	return True
+
+def test_lazy_contour():
+	# output read lazily is that read at once, with no more in memory than the budget allows
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	stress_contour_files([3,1,5,2,4])
+	c = fcontour('pyfehm_unittest.*_node.avs')
+	lazy = fcontour('pyfehm_unittest.*_node.avs',lazy=True,memory=0.01) 		# two times of 48 nodes and 10 variables
+	loaded = len(lazy._data._loaded)
+	sizes = []; same = True
+	for time in list(c.times)+list(c.times[::-1]):
+		same = same and all([np.array_equal(lazy[time][var],c[time][var]) for var in c.variables])
+		sizes.append(sum([lazy._data._size(t) for t in lazy._data._loaded]))
+	same = same and np.array_equal(lazy.array('P'),c.array('P'))
+	os.chdir(cwd)
+	if loaded > 2 or list(lazy.times) != list(c.times): print('output read before used'); return False
+	if not same: print('lazy output differs'); return False
+	if max(sizes) > 0.01e6 or len(lazy._data._loaded) > 2: print('memory budget exceeded'); return False
+	return True
+
+def test_parallel_contour():
+	# output read by several processes has the times and values of a serial read
+	import multiprocessing
+	if multiprocessing.get_start_method() != 'fork': return True 		# spawned workers would rerun this script
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	stress_contour_files([3,1,5,2,4])
+	c = fcontour('pyfehm_unittest.*_node.avs')
+	cp = fcontour('pyfehm_unittest.*_node.avs',workers=2)
+	os.chdir(cwd)
+	if list(cp.times) != list(c.times) or cp._times != c._times or cp.variables != c.variables: print('parallel read times differ'); return False
+	for var in c.variables:
+		if not np.array_equal(cp.array(var),c.array(var)): print('parallel read values differ'); return False
+	for var in ['x','y','z']:
+		if cp[5.][var] is not cp[1.][var] and not np.shares_memory(cp[5.][var],cp[1.][var]): print('coordinates not shared'); return False
+	return True
+
+def test_dense_contour():
+	# output for each time is a dictionary of views on one array per variable, with rows in time order
+	cwd = os.getcwd()
+	os.chdir(mkdtemp())
+	contour_files([4,1,2],[40.,10.,20.])
+	c = fcontour('pyfehm_unittest.*_node.avs')
+	os.chdir(cwd)
+	T = c.array('T')
+	if not np.array_equal(T,np.array([10.,20.,40.])[:,None]+np.arange(5)): print('wrong dense array'); return False
+	for i,time in enumerate(c.times):
+		for var in c.variables:
+			if not np.array_equal(c[time][var],c.array(var)[i]): print('dense array differs from dictionary'); return False
+		if not np.shares_memory(c[time]['T'],T): print('dictionary values not views'); return False
+	if c[1.]['x'] is not c[4.]['x']: print('coordinates stored for each time'); return False
+	T[1,0] = -1.
+	if c[2.]['T'][0] != -1.: print('dictionary values not views'); return False
+	return True
+
 #################### CONSTRUCTORS #########################
 print('Testing grid')
 geo = fgrid()
@@ -276,6 +738,86 @@ os.system('del pyfehm_unittest_INPUT*.*')
 os.system('del pyfehm_unittest_GRID*.*')
 os.system('del pyfehm_unittest_OUT*.*')
 
+print('Testing simulation cache')
+if not test_cache():
+	print('ERROR: simulation cache')
+
+print('Testing grid file links')
+if not test_grid_links():
+	print('ERROR: grid file links')
+
+print('Testing shared grids')
+if not test_publish():
+	print('ERROR: shared grids')
+
+print('Testing macro merging')
+if not test_macro_runs():
+	print('ERROR: macro merging')
+
+print('Testing clone')
+if not test_clone():
+	print('ERROR: clone')
+
+print('Testing ensemble runs')
+if not test_run_ensemble():
+	print('ERROR: ensemble runs')
+
+print('Testing input file section cache')
+if not test_section_cache():
+	print('ERROR: input file section cache')
+
+print('Testing restart file round trip')
+if not test_incon_round_trip():
+	print('ERROR: restart file round trip')
+
+print('Testing model archives')
+if not test_save_load():
+	print('ERROR: model archives')
+
+print('Testing contour cache')
+if not test_contour_cache():
+	print('ERROR: contour cache')
+
+print('Testing output time lookup')
+if not test_time_lookup():
+	print('ERROR: output time lookup')
+
+print('Testing contour follow mode')
+if not test_contour_follow():
+	print('ERROR: contour follow mode')
+
+print('Testing output parsing')
+if not test_parse_block():
+	print('ERROR: output parsing')
+
+print('Testing initial stress')
+if not test_stressgrad():
+	print('ERROR: initial stress')
+
+print('Testing stress output')
+if not test_stress_output():
+	print('ERROR: stress output')
+
+print('Testing interpolation')
+if not test_interpolation():
+	print('ERROR: interpolation')
+
+print('Testing derived variables')
+if not test_derived_variable():
+	print('ERROR: derived variables')
+
+print('Testing lazy contour output')
+if not test_lazy_contour():
+	print('ERROR: lazy contour output')
+
+print('Testing parallel contour reading')
+if not test_parallel_contour():
+	print('ERROR: parallel contour reading')
+
+print('Testing dense contour output')
+if not test_dense_contour():
+	print('ERROR: dense contour output')
+
 ###################
 print('No errors!')
 